@@ -16,6 +16,30 @@ MODEL_RAM = os.getenv("MODEL_RAM")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME") # FAISS and LangChain's VectorstoreRetriever
                                 # "intfloat/multilingual-e5-small" - 100 languages, compatible but basic
                                 # "BAAI/bge-small-en" - for English-only documents
+# Persistent chunk embedding cache (db/embedding_cache.db, know/embedcache.py), keyed by content hash
+# and EMBED_MODEL_NAME, so --rebuild-db only embeds new or changed chunks.
+EMBED_CACHE = getenv_bool("EMBED_CACHE", True)
+EMBED_CACHE_MAX_ENTRIES = getenv_int("EMBED_CACHE_MAX_ENTRIES", 1_000_000) # ~1.5 KB each at 384 dims
+EMBED_BATCH_SIZE = getenv_int("EMBED_BATCH_SIZE", 256)  # chunks embedded and added to FAISS per step
+EMBED_THREADS = getenv_int("EMBED_THREADS", 0)          # torch intra-op threads; 0 = torch default
+# In-process LRU of question embeddings (0 disables); PERSIST also keeps them in embedding_cache.db
+EMBED_QUERY_CACHE_SIZE = getenv_int("EMBED_QUERY_CACHE_SIZE", 1024)
+EMBED_QUERY_CACHE_PERSIST = getenv_bool("EMBED_QUERY_CACHE_PERSIST", False)
+
+# FAISS index type (know/faissindex.py): flat | hnsw | ivf_flat | ivf_sq8 | ivf_pq | auto
+# auto picks flat for small libraries, then the fastest type that fits FAISS_MEMORY_MB.
+# The choice is saved in index_config.json next to index.faiss and restored on load.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+FAISS_MEMORY_MB = getenv_int("FAISS_MEMORY_MB", 4096)          # RAM budget for the vector index
+FAISS_EXPECTED_CHUNKS = getenv_int("FAISS_EXPECTED_CHUNKS", 0) # minimum size to plan for (future growth)
+FAISS_TRAIN_SAMPLE = getenv_int("FAISS_TRAIN_SAMPLE", 65536)   # vectors sampled to train IVF quantizers
+FAISS_HNSW_M = getenv_int("FAISS_HNSW_M", 32)                  # graph links per vector
+FAISS_HNSW_EF_CONSTRUCTION = getenv_int("FAISS_HNSW_EF_CONSTRUCTION", 200)
+FAISS_HNSW_EF_SEARCH = getenv_int("FAISS_HNSW_EF_SEARCH", 64)  # higher = better recall, slower
+FAISS_HNSW_REBUILD_DELETED = getenv_float("FAISS_HNSW_REBUILD_DELETED", 0.1) # deleted share that triggers a graph rebuild
+FAISS_IVF_NLIST = getenv_int("FAISS_IVF_NLIST", 0)             # clusters; 0 = 4*sqrt(chunks)
+FAISS_IVF_NPROBE = getenv_int("FAISS_IVF_NPROBE", 16)          # clusters searched per query
+FAISS_PQ_M = getenv_int("FAISS_PQ_M", 0)                       # PQ sub-quantizers; 0 = dim/8
 LLAMA_CPP_PARAMS = {
     "model_path": MODEL_PATH,   # Path to your GGUF model file
     "temperature": 0.7,         # Sampling temperature; lower = deterministic, higher = more creative
@@ -35,8 +59,64 @@ LLAMA_CPP_PARAMS = {
     "verbose": True,            # Log info from backend
 }
 
+# Hybrid retrieval in know/hybrid.py: BM25 over SQLite FTS5 + FAISS vectors, fused with
+# reciprocal rank fusion. Set HYBRID_SEARCH=false to use the plain FAISS retriever.
+HYBRID_SEARCH = getenv_bool("HYBRID_SEARCH", True)
+HYBRID_K = getenv_int("HYBRID_K", 4)                    # chunks passed to the LLM per question
+HYBRID_FETCH_K = getenv_int("HYBRID_FETCH_K", 20)       # candidates fetched from each retriever
+HYBRID_VECTOR_WEIGHT = getenv_float("HYBRID_VECTOR_WEIGHT", 1.0)
+HYBRID_LEXICAL_WEIGHT = getenv_float("HYBRID_LEXICAL_WEIGHT", 1.0) # raise for rare names/titles
+HYBRID_RRF_K = getenv_int("HYBRID_RRF_K", 60)           # larger = flatter rank fusion
+HYBRID_TIMEOUT = getenv_float("HYBRID_TIMEOUT", 5.0)    # seconds per search before it is dropped
+
+# Context packing (know/contextpack.py): retrieved chunks fill the prompt in relevance order,
+# counted with the model's tokenizer; adjacent chunks of a document are merged without their
+# repeated CHUNK_OVERLAP text. Chunks that don't fit are left out. 0 = no limit besides n_ctx.
+CONTEXT_TOKEN_BUDGET = getenv_int("CONTEXT_TOKEN_BUDGET", 2048)
+# Tokens of n_ctx kept free for the answer; the budget shrinks so prompt + answer fit.
+CONTEXT_ANSWER_TOKENS = getenv_int("CONTEXT_ANSWER_TOKENS", 1024)
+
+# llama.cpp prompt (KV) cache in RAM (llm.py): the fixed system prompt is evaluated once at
+# warm-up and its state restored for every query; the state after each answer is kept too,
+# so follow-up chat turns reuse the conversation so far. A full 4096-token state of an 8B
+# model is ~0.5 GB; least recently used states are dropped. 0 = disabled.
+PROMPT_CACHE_MB = getenv_int("PROMPT_CACHE_MB", 1024)
+# Earlier turns of a Web UI chat included in the prompt (questions and answers, no context).
+# 0 = every question stands alone. Each turn shrinks the context budget.
+CHAT_HISTORY_TURNS = getenv_int("CHAT_HISTORY_TURNS", 0)
+
+# Answer cache (db/answer_cache.db, know/answercache.py): repeated questions over the same
+# retrieved chunks, model and sampling params skip generation. Cleared when the index changes.
+ANSWER_CACHE = getenv_bool("ANSWER_CACHE", True)
+ANSWER_CACHE_TTL_HOURS = getenv_float("ANSWER_CACHE_TTL_HOURS", 168)   # entries expire after a week
+ANSWER_CACHE_MAX_ENTRIES = getenv_int("ANSWER_CACHE_MAX_ENTRIES", 10_000)
+# Cosine similarity for serving near-duplicate questions (0 = exact matches only, e.g. 0.95)
+ANSWER_CACHE_SIMILARITY = getenv_float("ANSWER_CACHE_SIMILARITY", 0.0)
+
+# Read PDFs with PyMuPDF and OCR only the pages without a usable text layer (extract/pageocr.py,
+# needs tesseract). Also used by extract/extractor.py. Tuned with the OCR_* variables in .env.
+PDF_OCR_PAGES = getenv_bool("PDF_OCR_PAGES", False)
+
 GARBAGE_THRESHOLD = 0.7         # def chunk_documents(...) in retriever.py
 
+# Ingestion pipeline in retriever.py: worker processes load, clean and chunk files in parallel,
+# while the main process is the single SQLite writer. Set INGEST_WORKERS=1 to run sequentially.
+INGEST_WORKERS = getenv_int("INGEST_WORKERS", os.cpu_count() or 1)
+# Max files in flight (loaded or being loaded) ahead of the writer; bounds memory use.
+INGEST_QUEUE_DEPTH = getenv_int("INGEST_QUEUE_DEPTH", 2 * INGEST_WORKERS)
+# Tesseract processes per ingest worker with PDF_OCR_PAGES: each worker runs its own OCR pool,
+# so by default the CPUs are split between them instead of starting cpu_count pools of cpu_count.
+PDF_OCR_WORKERS = getenv_int("OCR_WORKERS", max(1, (os.cpu_count() or 1) // max(1, INGEST_WORKERS)))
+# Threads hashing new or changed files while scanning DATA_DIR (unchanged files are skipped
+# from size/mtime/inode in the file_manifest table without being read).
+INGEST_HASH_THREADS = getenv_int("INGEST_HASH_THREADS", 8)
+# Files written to metadata.db per transaction during ingestion; each batch is committed before its chunks are embedded.
+INGEST_COMMIT_EVERY = getenv_int("INGEST_COMMIT_EVERY", 50)
+
+# SQLite tuning for metadata.db (data/db.py). Connections run in WAL mode.
+SQLITE_CACHE_MB = getenv_int("SQLITE_CACHE_MB", 64)   # page cache per connection
+SQLITE_MMAP_MB = getenv_int("SQLITE_MMAP_MB", 256)    # memory-mapped I/O window
+
 # CHUNK_SIZE controls how large each document segment is (in tokens or characters depending on the loader).
 # Larger chunks give more context to the LLM, but require more memory and reduce retrieval precision.
 # A typical value is 512 tokens.
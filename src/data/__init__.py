@@ -1,7 +1,29 @@
 from .db import (
     init_db,
+    get_connection,
+    get_read_connection,
+    transaction,
     get_existing_hashes,
     insert_document,
     insert_chunks,
-    fetch_metadata_by_content
+    replace_rejected_chunks,
+    fetch_metadata_by_content,
+    search_chunks,
+    get_document_by_path,
+    get_document_hashes,
+    get_manifest,
+    get_documents_by_hash_algo,
+    update_document_hash,
+    upsert_manifest,
+    get_pending_documents,
+    mark_pending_indexed,
+    delete_document,
+    get_tombstones,
+    clear_tombstones,
+    count_chunks,
+    get_chunks_by_ids,
+    get_meta,
+    set_meta,
+    get_index_version,
+    bump_index_version
 )
\ No newline at end of file
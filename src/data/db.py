@@ -1,19 +1,107 @@
 import os
+import re
 from pathlib import Path
 import shutil
 import sqlite3
 import sys
+import threading
+import uuid
+from contextlib import closing, contextmanager
 from datetime import datetime
+from config import SQLITE_CACHE_MB, SQLITE_MMAP_MB
 from data.jsonhandler import ensure_normalization_json, JSON_PATH
 
 DB_PATH = Path("db/metadata.db")
 
+# === Connection Manager ===
+# One write connection and one read-only connection per thread, opened lazily and
+# reused for the life of the thread. Schema setup runs once per process.
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_generation = 0 # bumped by close_all_connections so every thread reopens
+_schema_ready = False
+_initialized = False
+_fts_enabled = False # set by _create_schema when this SQLite build has FTS5
+
+def _open_connection(read_only: bool = False) -> sqlite3.Connection:
+    # check_same_thread=False only so close_all_connections() can close them on rebuild;
+    # each connection is still used by the thread that opened it.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")       # readers don't block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")     # safe with WAL, far fewer fsyncs
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}") # negative = KiB
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def _thread_connection(attr: str, read_only: bool) -> sqlite3.Connection:
+    cached = getattr(_local, attr, None)
+    if cached is not None and cached[0] == _generation:
+        return cached[1]
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True) # create db directory
+    conn = _open_connection(read_only)
+    setattr(_local, attr, (_generation, conn))
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's write connection, creating the schema on first use."""
+    conn = _thread_connection("conn", read_only=False)
+    _ensure_schema(conn)
+    return conn
+
+def get_read_connection() -> sqlite3.Connection:
+    """Return this thread's read-only connection (safe for Gradio worker threads)."""
+    get_connection() # make sure the schema exists before reading
+    return _thread_connection("read_conn", read_only=True)
+
+def close_all_connections():
+    """Close every pooled connection (checkpointing the WAL), e.g. before moving the DB file."""
+    global _generation, _schema_ready
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _generation += 1
+    with _schema_lock:
+        _schema_ready = False
+
+@contextmanager
+def transaction():
+    """Group many helper calls into one commit (e.g. a batch of ingested files).
+    Nested use is allowed; only the outermost block commits or rolls back."""
+    conn = get_connection()
+    _local.depth = getattr(_local, "depth", 0) + 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.rollback()
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        conn.commit()
+
+def _commit(conn: sqlite3.Connection):
+    # Helpers commit on their own unless they run inside transaction()
+    if getattr(_local, "depth", 0) == 0:
+        conn.commit()
+
 def is_metadata_db_empty() -> bool:
     """Check if metadata.db exists and contains chunks."""
     if not DB_PATH.exists():
         return True
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with closing(sqlite3.connect(DB_PATH)) as conn:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM chunks")
             return cur.fetchone()[0] == 0
@@ -26,15 +114,22 @@ def backup_old_db():
         print("[Warn] backup_old_db() called, but metadata.db does not exist.")
         return
     try:
+        close_all_connections() # checkpoints the WAL into metadata.db
         timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
         backup_path = DB_PATH.with_name(f"metadata_{timestamp}.db")
         shutil.move(DB_PATH, backup_path)
+        for suffix in ("-wal", "-shm"):
+            Path(f"{DB_PATH}{suffix}").unlink(missing_ok=True)
         print(f"[Backup] Old DB moved to: {backup_path}")
     except Exception as e:
         print(f"[Error] Failed to back up old DB: {e}")
 
 def init_db(rebuild=False) -> sqlite3.Connection:
     """Initialize the SQLite database and schema."""
+    global _initialized
+    if _initialized and not rebuild:
+        return get_connection()
+
     if not JSON_PATH.exists() and not rebuild:
         print(f"[Error] Normalization map not found at {JSON_PATH}")
         print("[Hint] Run with --rebuild-db to generate it.")
@@ -61,11 +156,26 @@ def init_db(rebuild=False) -> sqlite3.Connection:
         else:
             print("[Info] No existing DB found — skipping backup and deletion.")
     
-    conn = sqlite3.connect(DB_PATH)
-    if db_already_exists:
+    conn = get_connection()
+    if db_already_exists and not rebuild:
             print(f"Loaded existing metadata.db")
     else:
             print(f"[Info] Creating new metadata.db")  
+    _initialized = True
+    return conn
+
+def _ensure_schema(conn: sqlite3.Connection):
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        _create_schema(conn)
+        _schema_ready = True
+
+def _create_schema(conn: sqlite3.Connection):
+    global _fts_enabled
     cur = conn.cursor()
 
     cur.execute('''
@@ -82,7 +192,7 @@ def init_db(rebuild=False) -> sqlite3.Connection:
 
     cur.execute('''
         CREATE TABLE IF NOT EXISTS chunks (
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY AUTOINCREMENT, -- never reused: chunk ids are FAISS ids and tombstones
             document_id INTEGER,
             chunk_index INTEGER,
             content TEXT,
@@ -90,42 +200,412 @@ def init_db(rebuild=False) -> sqlite3.Connection:
         )
     ''')
 
+    # Chunk quality scores (know.retriever.score_chunk) and per-document chunk counts,
+    # added to databases created before they existed
+    _add_missing_columns(cur, "documents", {"chunk_count": "INTEGER", "trash_count": "INTEGER"})
+    _add_missing_columns(cur, "chunks", {
+        "length": "INTEGER",
+        "printable_ratio": "REAL",
+        "alnum_ratio": "REAL",
+        "unicode_ratio": "REAL",
+        "page": "INTEGER", # page the chunk starts on (ingest.chunker.split_pages), NULL if unknown
+    })
+
+    # Chunk ids whose vectors are still in FAISS after the chunk row was deleted.
+    # Cleared by know.store once the vectors have been removed from the index.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_tombstones (
+            chunk_id INTEGER PRIMARY KEY,
+            deleted_at TEXT
+        )
+    ''')
+
+    _migrate_chunk_ids(cur)
+
+    # Quality scores of chunks that were not stored: trash chunks, and every chunk of a file
+    # rejected by GARBAGE_THRESHOLD. position is the chunk's place among all chunks of the file.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rejected_chunks (
+            path TEXT,
+            hash TEXT,
+            position INTEGER,
+            page INTEGER,
+            length INTEGER,
+            printable_ratio REAL,
+            alnum_ratio REAL,
+            unicode_ratio REAL,
+            PRIMARY KEY (path, position)
+        )
+    ''')
+
+    # Stat signature and content hash of every scanned file in DATA_DIR, so files whose
+    # size, mtime and inode are unchanged are skipped without reading them.
+    # status: indexed | pending (in documents, FAISS not saved yet) | rejected (unsupported, garbage,
+    # no chunks, duplicate content) | error
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS file_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            hash TEXT,
+            hash_algo TEXT,
+            status TEXT
+        )
+    ''')
+
+    # Small key/value store for state shared by the index and caches (e.g. index_version)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    _fts_enabled = _create_fts(cur)
     conn.commit()
-    return conn
+
+def _migrate_chunk_ids(cur: sqlite3.Cursor):
+    """Recreate a chunks table made without AUTOINCREMENT, keeping its ids. Plain rowid
+    tables hand the highest deleted ids out again, so an edited file's new chunks got the
+    ids its old (tombstoned) chunks had in FAISS."""
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chunks'")
+    if "AUTOINCREMENT" in cur.fetchone()[0].upper():
+        return
+    cur.execute("PRAGMA table_info(chunks)")
+    columns = [(row[1], row[2]) for row in cur.fetchall() if row[1] != "id"]
+    names = ", ".join(name for name, _ in columns)
+    print("[Info] Migrating chunks table to never reuse chunk ids...")
+    cur.execute(f'''
+        CREATE TABLE chunks_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {", ".join(f"{name} {sql_type}" for name, sql_type in columns)},
+            FOREIGN KEY(document_id) REFERENCES documents(id)
+        )
+    ''')
+    cur.execute(f"INSERT INTO chunks_new (id, {names}) SELECT id, {names} FROM chunks")
+    cur.execute("DROP TABLE chunks") # drops the FTS triggers too; _create_fts recreates them
+    cur.execute("ALTER TABLE chunks_new RENAME TO chunks")
+    # Start above every id FAISS may still hold, including tombstoned ones
+    cur.execute("DELETE FROM sqlite_sequence WHERE name = 'chunks'")
+    cur.execute('''
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'chunks', MAX(
+            COALESCE((SELECT MAX(id) FROM chunks), 0),
+            COALESCE((SELECT MAX(chunk_id) FROM chunk_tombstones), 0))
+    ''')
+
+def _add_missing_columns(cur: sqlite3.Cursor, table: str, columns: dict):
+    cur.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cur.fetchall()}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+def _create_fts(cur: sqlite3.Cursor) -> bool:
+    """Create the FTS5 index over chunks.content, kept in sync by triggers.
+    Existing databases are backfilled once. Returns False if FTS5 is unavailable."""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'")
+    fts_existed = cur.fetchone() is not None
+    try:
+        # External-content table: the text lives only in chunks, FTS stores the index
+        cur.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                content,
+                content='chunks',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[Warn] SQLite FTS5 unavailable ({e}); content lookups fall back to LIKE scans.")
+        return False
+
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF content ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
+
+    if not fts_existed:
+        cur.execute("SELECT COUNT(*) FROM chunks")
+        n_chunks = cur.fetchone()[0]
+        if n_chunks:
+            print(f"[Info] Building full-text index for {n_chunks} existing chunks...")
+            cur.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+    return True
 
 def get_existing_hashes():
-    conn = init_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT hash FROM documents")
     return set(row[0] for row in cur.fetchall())
 
-def insert_document(path, title, hash_, source_type, embedding_model):
-    conn = init_db()
+def insert_document(path, title, hash_, source_type, embedding_model, chunk_count=None, trash_count=None):
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
-        INSERT INTO documents (path, title, hash, timestamp, source_type, embedding_model)
-        VALUES (?, ?, ?, datetime('now'), ?, ?)
-    ''', (path, title, hash_, source_type, embedding_model))
-    conn.commit()
+        INSERT INTO documents (path, title, hash, timestamp, source_type, embedding_model, chunk_count, trash_count)
+        VALUES (?, ?, ?, datetime('now'), ?, ?, ?, ?)
+    ''', (path, title, hash_, source_type, embedding_model, chunk_count, trash_count))
+    _commit(conn)
     return cur.lastrowid
 
-def insert_chunks(doc_id, chunks: list[tuple[str, dict]]):
-    conn = init_db()
+def insert_chunks(doc_id, chunks: list[tuple[str, dict]]) -> list[int]:
+    """Insert chunks of a document and return their chunks.id values in order.
+    These ids are also the FAISS docstore ids of the chunk vectors."""
+    conn = get_connection()
     cur = conn.cursor()
+    chunk_ids = []
+    for i, (chunk_text, metadata) in enumerate(chunks):
+        quality = (metadata or {}).get("quality") or (None, None, None, None)
+        page = (metadata or {}).get("page")
+        cur.execute('''
+            INSERT INTO chunks (document_id, chunk_index, content, length, printable_ratio, alnum_ratio, unicode_ratio, page)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (doc_id, i, chunk_text, *quality, page))
+        chunk_ids.append(cur.lastrowid)
+    _commit(conn)
+    return chunk_ids
+
+def replace_rejected_chunks(path, hash_, chunks: list[tuple[int, dict]]):
+    """Store the scores of a file's rejected chunks, given as (position, metadata)
+    like insert_chunks, replacing those of its previous version."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM rejected_chunks WHERE path = ?", (path,))
     cur.executemany('''
-        INSERT INTO chunks (document_id, chunk_index, content)
-        VALUES (?, ?, ?)
-    ''', [(doc_id, i, chunk_text) for i, (chunk_text, _) in enumerate(chunks)])
-    conn.commit()
+        INSERT INTO rejected_chunks (path, hash, position, page, length, printable_ratio, alnum_ratio, unicode_ratio)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(path, hash_, position, metadata.get("page"), *metadata["quality"]) for position, metadata in chunks])
+    _commit(conn)
 
-def fetch_metadata_by_content(content_substring):
-    conn = init_db()
+def get_document_hashes() -> dict[str, str]:
+    """path -> content hash of every indexed document."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT path, hash FROM documents")
+    return dict(cur.fetchall())
+
+def get_documents_by_hash_algo(hash_algo: str) -> list[tuple[int, str, str, str]]:
+    """(id, path, hash, algo) of documents whose hash was not made with hash_algo.
+    algo is NULL for documents indexed before the file manifest existed (md5)."""
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
-        SELECT d.title, d.timestamp, d.path FROM documents d
-        JOIN chunks c ON c.document_id = d.id
-        WHERE c.content LIKE ?
-        LIMIT 1
-    ''', (f"%{content_substring[:50]}%",))
+        SELECT d.id, d.path, d.hash, m.hash_algo FROM documents d
+        LEFT JOIN file_manifest m ON m.path = d.path
+        WHERE m.hash_algo IS NULL OR m.hash_algo != ?
+    ''', (hash_algo,))
+    return cur.fetchall()
+
+def update_document_hash(doc_id, hash_):
+    conn = get_connection()
+    conn.execute("UPDATE documents SET hash = ? WHERE id = ?", (hash_, doc_id))
+    _commit(conn)
+
+def get_manifest() -> dict[str, tuple]:
+    """path -> (size, mtime_ns, inode, hash, hash_algo, status) of every scanned file."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT path, size, mtime_ns, inode, hash, hash_algo, status FROM file_manifest")
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+def upsert_manifest(path, size, mtime_ns, inode, hash_, hash_algo, status):
+    conn = get_connection()
+    conn.execute('''
+        INSERT OR REPLACE INTO file_manifest (path, size, mtime_ns, inode, hash, hash_algo, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (path, size, mtime_ns, inode, hash_, hash_algo, status))
+    _commit(conn)
+
+def get_pending_documents() -> list[tuple[int, str]]:
+    """(id, path) of documents inserted by an ingest whose FAISS index was never saved."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT d.id, d.path FROM documents d
+        JOIN file_manifest m ON m.path = d.path
+        WHERE m.status = 'pending'
+    ''')
+    return cur.fetchall()
+
+def mark_pending_indexed() -> int:
+    """Mark pending manifest rows indexed once their vectors are saved. Returns the row count."""
+    conn = get_connection()
+    cur = conn.execute("UPDATE file_manifest SET status = 'indexed' WHERE status = 'pending'")
+    _commit(conn)
+    return cur.rowcount
+
+def get_document_by_path(path):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, hash FROM documents WHERE path = ?", (path,))
+    row = cur.fetchone()
+    return {"id": row[0], "hash": row[1]} if row else None
+
+def delete_document(doc_id) -> list[int]:
+    """Delete a document and its chunks, tombstoning the chunk ids so their
+    vectors get removed from FAISS, and forget files rejected as its duplicates.
+    Returns the tombstoned chunk ids."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM chunks WHERE document_id = ?", (doc_id,))
+    chunk_ids = [row[0] for row in cur.fetchall()]
+    cur.executemany('''
+        INSERT OR IGNORE INTO chunk_tombstones (chunk_id, deleted_at)
+        VALUES (?, datetime('now'))
+    ''', [(chunk_id,) for chunk_id in chunk_ids])
+    cur.execute("DELETE FROM file_manifest WHERE path = (SELECT path FROM documents WHERE id = ?)", (doc_id,))
+    # Copies rejected as duplicates of this document get scanned again, the first becomes the original
+    cur.execute('''
+        DELETE FROM file_manifest WHERE status = 'rejected'
+        AND hash = (SELECT hash FROM documents WHERE id = ?)
+    ''', (doc_id,))
+    cur.execute("DELETE FROM rejected_chunks WHERE path = (SELECT path FROM documents WHERE id = ?)", (doc_id,))
+    cur.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+    cur.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+    bump_index_version()
+    _commit(conn)
+    return chunk_ids
+
+def get_tombstones() -> set[int]:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT chunk_id FROM chunk_tombstones")
+    return set(row[0] for row in cur.fetchall())
+
+def clear_tombstones(chunk_ids):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.executemany("DELETE FROM chunk_tombstones WHERE chunk_id = ?", [(i,) for i in chunk_ids])
+    _commit(conn)
+
+def get_chunks_by_ids(chunk_ids) -> dict[int, dict]:
+    """Fetch chunk text and document metadata by chunks.id (FAISS docstore lookups)."""
+    conn = get_read_connection()
+    cur = conn.cursor()
+    chunk_ids = list(chunk_ids)
+    marks = ",".join("?" * len(chunk_ids))
+    cur.execute(f'''
+        SELECT c.id, c.document_id, c.chunk_index, c.content, d.title, d.path, c.page
+        FROM chunks c JOIN documents d ON d.id = c.document_id
+        WHERE c.id IN ({marks})
+    ''', chunk_ids)
+    return {
+        row[0]: {"chunk_id": row[0], "doc_id": row[1], "chunk_index": row[2], "content": row[3],
+                 "title": row[4], "path": row[5], "page": row[6]}
+        for row in cur.fetchall()
+    }
+
+def get_meta(key, default=None):
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM meta WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row[0] if row else default
+
+def set_meta(key, value):
+    conn = get_connection()
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+    _commit(conn)
+
+def get_index_version() -> str:
+    return get_meta("index_version", "")
+
+def bump_index_version() -> str:
+    """Mark the searchable corpus as changed. Random rather than a counter so a
+    rebuilt metadata.db never reuses an old version; caches key on it."""
+    version = uuid.uuid4().hex
+    set_meta("index_version", version)
+    return version
+
+def count_chunks() -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM chunks")
+    return cur.fetchone()[0]
+
+# === Full-text search (FTS5) ===
+_FTS_TOKEN = re.compile(r"[^\W_]+")
+
+def fts_query(text: str, phrase: bool = False, match_all: bool = True, prefix_last: bool = False) -> str:
+    """Turn free text into a safe FTS5 MATCH expression.
+    phrase=True matches the tokens in order; otherwise they are ANDed (match_all) or ORed.
+    prefix_last=True lets the last token match as a prefix (for truncated input)."""
+    tokens = _FTS_TOKEN.findall(text)
+    if not tokens:
+        return ""
+    if phrase:
+        return '"' + " ".join(tokens) + '"' + (" *" if prefix_last else "")
+    terms = [f'"{token}"' for token in tokens]
+    if prefix_last:
+        terms[-1] += " *"
+    return (" AND " if match_all else " OR ").join(terms)
+
+def search_chunks(query: str, limit: int = 10, phrase: bool = False, match_all: bool = True) -> list[dict]:
+    """Exact-phrase or keyword search over chunk text, best BM25 match first."""
+    match = fts_query(query, phrase=phrase, match_all=match_all)
+    if not match:
+        return []
+    conn = get_read_connection()
+    cur = conn.cursor()
+    if _fts_enabled:
+        cur.execute('''
+            SELECT c.id, c.document_id, c.chunk_index, c.content, d.title, d.path, bm25(chunks_fts) AS score, c.page
+            FROM chunks_fts
+            JOIN chunks c ON c.id = chunks_fts.rowid
+            JOIN documents d ON d.id = c.document_id
+            WHERE chunks_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (match, limit))
+    else: # no FTS5 in this SQLite build: exact phrase only, unranked full scan
+        cur.execute('''
+            SELECT c.id, c.document_id, c.chunk_index, c.content, d.title, d.path, 0.0, c.page
+            FROM chunks c JOIN documents d ON d.id = c.document_id
+            WHERE c.content LIKE ?
+            LIMIT ?
+        ''', (f"%{query}%", limit))
+    return [
+        {"chunk_id": row[0], "doc_id": row[1], "chunk_index": row[2], "content": row[3],
+         "title": row[4], "path": row[5], "score": row[6], "page": row[7]}
+        for row in cur.fetchall()
+    ]
+
+def fetch_metadata_by_content(content_substring):
+    snippet = content_substring[:50]
+    conn = get_read_connection()
+    cur = conn.cursor()
+    # The snippet may start or end inside a word, which FTS5 never matches as a token:
+    # use only its inner, whole tokens for the phrase
+    inner = _FTS_TOKEN.findall(snippet)[1:-1]
+    if _fts_enabled and len(inner) >= 3:
+        # FTS5 narrows to a handful of rows; LIKE then checks the exact substring on those only.
+        # A miss here is final: a full scan would not find text FTS5 has indexed either
+        cur.execute('''
+            SELECT d.title, d.timestamp, d.path FROM chunks_fts
+            JOIN chunks c ON c.id = chunks_fts.rowid
+            JOIN documents d ON d.id = c.document_id
+            WHERE chunks_fts MATCH ? AND c.content LIKE ?
+            LIMIT 1
+        ''', (fts_query(" ".join(inner), phrase=True), f"%{snippet}%"))
+    else: # no FTS5, or too few whole tokens to narrow the search: full scan
+        cur.execute('''
+            SELECT d.title, d.timestamp, d.path FROM documents d
+            JOIN chunks c ON c.document_id = d.id
+            WHERE c.content LIKE ?
+            LIMIT 1
+        ''', (f"%{snippet}%",))
     row = cur.fetchone()
-    return {"title": row[0], "timestamp": row[1], "path": row[2]} if row else {}
\ No newline at end of file
+    return {"title": row[0], "timestamp": row[1], "path": row[2]} if row else {}
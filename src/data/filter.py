@@ -1,10 +1,10 @@
 import re
 import unicodedata
 import ftfy
-from data.jsonhandler import apply_normalization, load_normalization_map
+from data.jsonhandler import Normalizer
 
 # === Load Normalization Rules ===
-normalization_rules = load_normalization_map(create_if_missing=False) # Print loading/failure message
+normalizer = Normalizer() # compiled once, recompiled when normalization_map.json changes
 '''
 The normalization JSON is used here to clean and normalize 
 the entire raw text (fixing ligatures, punctuation, OCR artifacts, etc).
@@ -13,11 +13,12 @@ This filtered text is cleaned and normalized, ready to be chunked.
 def normalize_unicode(text: str) -> str:
     text = ftfy.fix_text(text)
     text = unicodedata.normalize("NFKC", text)
-    return apply_normalization(text, normalization_rules)
+    return normalizer.normalize(text)
 
 # === Export to chunker >>>
-def clean_text(raw: str) -> str:
-    print(f"[Cleaning] Input length: {len(raw)}")
+def clean_text(raw: str, verbose: bool = True) -> str:
+    if verbose:
+        print(f"[Cleaning] Input length: {len(raw)}")
     text = normalize_unicode(raw)
     text = text.strip()
 
@@ -32,5 +33,6 @@ def clean_text(raw: str) -> str:
     text = re.sub(r"(?:Edited by|Translated by|PENES NOS|MDC.*|©.*)", "", text, flags=re.IGNORECASE)
 
     text = re.sub(r" {2,}", " ", text)  # Remove double spaces
-    print(f"[Cleaning] Output length: {len(text)}")
+    if verbose:
+        print(f"[Cleaning] Output length: {len(text)}")
     return text
\ No newline at end of file
@@ -88,13 +88,118 @@ def save_normalization_map(data: dict, path: Path = JSON_PATH):
         logger.error(f"Error saving normalization map to {path}: {e}")
 
 # === Apply Normalization ===
+_REGEX_META = set(".^$*+?{}[]|()")
+_WORD = re.compile(r"\w+")
+
+def _literal(pattern: str) -> str | None:
+    """Return the text an escaped-literal pattern matches, or None if it is a real regex."""
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                return None  # \d, \s, \b... inside the pattern
+            out.append(pattern[i + 1])
+            i += 2
+            continue
+        if c in _REGEX_META:
+            return None
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+def _trie_regex(words) -> str:
+    """Alternation of literals as a prefix trie, so matching cost does not grow with the word count."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node) -> str:
+        end = node.get("") is True
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if end else body
+    return build(trie)
+
+class Normalizer:
+    r"""
+    Compiled normalization map. Loaded once and reloaded only when the JSON file's
+    mtime changes (e.g. after ocr2map.py or update_ocr_fixes add entries).
+        single-char ligatures/punctuation -> one str.translate
+        multi-char ligatures/punctuation  -> one trie regex + dict lookup
+        \bword\b OCR fixes                -> one \w+ scan + dict lookup
+        \bmulti word\b OCR fixes          -> one trie regex + dict lookup
+        any other regex                   -> applied one by one, in map order
+    Cost per text stays flat as the literal fixes grow into the thousands.
+    """
+    def __init__(self, path: Path = JSON_PATH, norm_map: dict = None):
+        self.path = path
+        self._mtime = None
+        if norm_map is not None:
+            self._compile(norm_map)
+        else:
+            self.reload_if_changed()
+
+    @classmethod
+    def from_map(cls, norm_map: dict) -> "Normalizer":
+        return cls(path=None, norm_map=norm_map)
+
+    def reload_if_changed(self):
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime or not hasattr(self, "_table"):
+            self._compile(load_normalization_map(self.path))
+            self._mtime = mtime
+
+    def _compile(self, norm_map: dict):
+        chars, strings = {}, {}
+        for cat in ["ligatures", "punctuation"]:
+            for bad, good in norm_map.get(cat, {}).items():
+                (chars if len(bad) == 1 else strings)[bad] = good
+        self._table = str.maketrans(chars)
+        self._strings = strings
+        self._strings_re = re.compile(_trie_regex(strings)) if strings else None
+
+        self._words, self._phrases, self._regexes = {}, {}, []
+        for pattern, repl in norm_map.get("ocr_artifacts", {}).items():
+            inner = pattern[2:-2] if pattern.startswith(r"\b") and pattern.endswith(r"\b") else None
+            text = _literal(inner) if inner else None
+            if text and _WORD.fullmatch(text):
+                self._words.setdefault(text, repl)
+            elif text:
+                self._phrases.setdefault(text, repl)
+            else:
+                try:
+                    self._regexes.append((re.compile(pattern), repl))
+                except re.error as e:
+                    logger.error(f"Skipping invalid OCR pattern {pattern!r}: {e}")
+        self._phrases_re = re.compile(rf"\b{_trie_regex(self._phrases)}\b") if self._phrases else None
+
+    def normalize(self, text: str) -> str:
+        self.reload_if_changed()
+        text = text.translate(self._table)
+        if self._strings_re:
+            text = self._strings_re.sub(lambda m: self._strings[m.group()], text)
+        if self._words:
+            words = self._words
+            text = _WORD.sub(lambda m: words.get(m.group(), m.group()), text)
+        if self._phrases_re:
+            text = self._phrases_re.sub(lambda m: self._phrases.get(m.group(), m.group()), text)
+        for pattern, repl in self._regexes:
+            text = pattern.sub(repl, text)
+        return text
+
 def apply_normalization(text: str, norm_map: dict) -> str:
-    for cat in ["ligatures", "punctuation"]:
-        for bad, good in norm_map.get(cat, {}).items():
-            text = text.replace(bad, good)
-    for pattern, repl in norm_map.get("ocr_artifacts", {}).items():
-        text = re.sub(pattern, repl, text)
-    return text
+    return Normalizer.from_map(norm_map).normalize(text)
 # NOT USED >
 def apply_regex_normalization(text: str, regex_rules: list[tuple[str, str]]) -> str:
     for pattern, repl in regex_rules:
@@ -1,22 +1,18 @@
-from data import init_db
+from data import get_read_connection, delete_document, get_document_by_path
 
 def list_documents():
-    conn = init_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, path, timestamp FROM documents")
     for row in cur.fetchall():
         print(row)
 
 def delete_document_by_path(path):
-    conn = init_db()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM documents WHERE path = ?", (path,))
-    row = cur.fetchone()
-    if row:
-        doc_id = row[0]
-        cur.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
-        cur.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-        conn.commit()
-        print(f"Deleted: {path}")
+    # Chunk vectors are tombstoned: hidden from retrieval at once,
+    # removed from FAISS by the next compaction (know.store).
+    doc = get_document_by_path(path)
+    if doc:
+        chunk_ids = delete_document(doc["id"])
+        print(f"Deleted: {path} ({len(chunk_ids)} vectors pending compaction)")
     else:
         print("Document not found.")
\ No newline at end of file
@@ -1,8 +1,8 @@
 import sqlite3
-from data import init_db
+from data import get_read_connection
 
 def query_documents(filetype=None, date_after=None, skip_tags=None):
-    conn = init_db()
+    conn = get_read_connection()
     cur = conn.cursor()
 
     sql = "SELECT path, title, timestamp FROM documents WHERE 1=1"
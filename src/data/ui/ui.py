@@ -1,14 +1,14 @@
 import gradio as gr
-from data import init_db
+from data import get_read_connection
 
 def list_titles_by_type(filetype):
-    conn = init_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute("SELECT title FROM documents WHERE source_type = ?", (filetype,))
     return [row[0] for row in cur.fetchall()]
 
 def view_document(title):
-    conn = init_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('''
         SELECT c.content FROM chunks c
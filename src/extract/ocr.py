@@ -1,100 +1,33 @@
-import fitz  # PyMuPDF
-import io
 import os
-import pytesseract
 import re
-import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 # PYTHONPATH=./src python scripts/ocr.py
 from pathlib import Path
-from PIL import Image
 from dotenv import load_dotenv
 load_dotenv()
+from pageocr import (OCR_CONCURRENT_FILES, OCR_WORKERS, detect_language_from_filename, forget_checkpoints,
+                     ocr_djvu, ocr_image, pdf_text_with_ocr, shutdown_pool, submit)
+from sourceindex import SourceIndex, find_empty_txt, load_source_index
 
 DST_DIR = Path(os.getenv("DST_DIR")) # extracted text files
 SRC_DIR = Path(os.getenv("SRC_DIR")) # original files => pdf, etc
 OCRD_LOG=Path(os.getenv("OCRD_LOG")) # optically character recognised files list prevents overwriting
 OCR_CANDIDATES=Path(os.getenv("OCR_CANDIDATES")) # list of files to be OCRed appends from DST_DIR
+OCR_SOURCE_INDEX = Path(os.getenv("OCR_SOURCE_INDEX")) if os.getenv("OCR_SOURCE_INDEX") else None # optional JSON cache of the SRC_DIR index
 
 print("[.env] DST_DIR:", DST_DIR)
 print("[.env] SRC_DIR:", SRC_DIR)
 print("[.env] OCRD_LOG:", OCRD_LOG)
 print("[.env] OCR_CANDIDATES:", OCR_CANDIDATES)
+print("[.env] OCR_SOURCE_INDEX:", OCR_SOURCE_INDEX)
 print("Searching...")
 # ========================================================================
 # ========================================================================
 # ========================================================================
-def detect_language_from_filename(file_path: Path) -> str:
-    name = file_path.name.lower()
-
-    lang_keywords = {
-        # Cyrillic and Slavic
-        "rus": "rus", "russian": "rus", "рос": "rus",
-        "ukr": "ukr", "ukrainian": "ukr",
-        # "bul": "bul", "bulgarian": "bul",
-        # "srp": "srp", "serbian": "srp",
-        # "srp_latn": "srp_latn",
-        "bel": "bel", "belarusian": "bel",
-        # "kaz": "kaz", "kazakh": "kaz",
-        # "uzb": "uzb", "uzbek": "uzb",
-        # "uzb_cyrl": "uzb_cyrl",
-        # "kir": "kir", "kyrgyz": "kir",
-        # "tgk": "tgk", "tajik": "tgk",
-        # "tat": "tat", "tatar": "tat",
-        # "mkd": "mkd", "macedonian": "mkd",
-
-        # Western languages
-        "eng": "eng", "english": "eng",
-        # "deu": "deu", "ger": "deu", "german": "deu",
-        # "fra": "fra", "fre": "fra", "french": "fra",
-        # "ita": "ita", "italian": "ita",
-        # "spa": "spa", "spanish": "spa",
-        # "por": "por", "portuguese": "por",
-        "pol": "pol", "polish": "pol", "polska": "pol",
-        # "nld": "nld", "dutch": "nld",
-        # "swe": "swe", "swedish": "swe",
-        # "dan": "dan", "danish": "dan",
-        "nor": "nor", "norwegian": "nor",
-        # "fin": "fin", "finnish": "fin",
-
-        # # Asian languages
-        # "chi_sim": "chi_sim", "zh_cn": "chi_sim", "simplified": "chi_sim",
-        # "chi_tra": "chi_tra", "zh_tw": "chi_tra", "traditional": "chi_tra",
-        # "jpn": "jpn", "japanese": "jpn",
-        # "kor": "kor", "korean": "kor",
-        # "hin": "hin", "hindi": "hin",
-        # "tam": "tam", "tamil": "tam",
-        # "tel": "tel", "telugu": "tel",
-        # "kan": "kan", "kannada": "kan",
-        # "mal": "mal", "malayalam": "mal",
-        # "mya": "mya", "burmese": "mya",
-        # "tha": "tha", "thai": "tha",
-        # "vie": "vie", "vietnamese": "vie",
-
-        # Others
-        # "ara": "ara", "arabic": "ara",
-        # "heb": "heb", "hebrew": "heb",
-        # "grc": "grc", "greek": "ell",
-        # "ell": "ell", "modern_greek": "ell",
-        # "amh": "amh", "ethiopic": "amh",
-        # "ben": "ben", "bengali": "ben",
-        # "guj": "guj", "gujarati": "guj",
-        # "pan": "pan", "punjabi": "pan",
-        # "urd": "urd", "urdu": "urd",
-        # "syr": "syr", "syriac": "syr",
-        # "san": "san", "sanskrit": "san",
-        # "nep": "nep", "nepali": "nep",
-    }
-
-    for key, lang in lang_keywords.items():
-        if key in name:
-            return lang
-    return "eng"  # default fallback
-
-
 def ocr_image_file(file_path, lang="eng"):
     try:
-        img = Image.open(file_path)
-        return pytesseract.image_to_string(img, lang=lang)
+        return submit(ocr_image, str(file_path), lang).result() # counts against OCR_WORKERS
     except Exception as e:
         print(f"[ERROR] OCR failed on image {file_path}: {e}")
         return ""
@@ -102,29 +35,20 @@ def ocr_image_file(file_path, lang="eng"):
 
 def ocr_pdf_file(file_path, lang="eng"):
     try:
-        doc = fitz.open(file_path)
-        return "\n\n".join(
-            pytesseract.image_to_string(
-                Image.open(io.BytesIO(page.get_pixmap(alpha=False).tobytes())),
-                lang=lang
-            ) for page in doc
-        )
+        # Only pages without a usable text layer are OCR'd (in parallel); merged in page order
+        return pdf_text_with_ocr(file_path, lang)
     except Exception as e:
         print(f"[ERROR] OCR failed on PDF {file_path}: {e}")
         return ""
 
 
 def ocr_djvu_file(file_path, lang="eng"):
-    png_path = file_path.with_suffix(".djvu.png")
     try:
-        subprocess.run(["ddjvu", "-format=png", str(file_path), str(png_path)], check=True)
-        return ocr_image_file(png_path, lang)
+        # Every page rendered to its own temp image and OCR'd in parallel, joined in page order
+        return ocr_djvu(file_path, lang)
     except Exception as e:
         print(f"[ERROR] OCR failed on DjVu file {file_path}: {e}")
         return ""
-    finally:
-        if png_path.exists():
-            png_path.unlink()
 
 
 def ocr_file(file_path, lang=None):
@@ -161,31 +85,31 @@ def strip_timestamp_and_txt(txt_stem: str) -> str:
 # ========================================================================
 # ========================================================================
 # ======================================================================== 
-def append_missing_candidates(dst_dir: Path, src_dir: Path, pending_path: Path):
+def append_missing_candidates(dst_dir: Path, src_dir: Path, pending_path: Path,
+                              empty_txt: list[Path] = None, src_index: SourceIndex = None):
     pending_path.parent.mkdir(parents=True, exist_ok=True)
 
-    dst_files = sorted(dst_dir.rglob("*.txt"))
-    if not dst_files:
-        print(f"[INFO] No .txt files in {dst_dir}.")
+    # Consider empty .txt files only; both scans are done once and shared with find_ocr_candidates
+    empty_txt = find_empty_txt(dst_dir) if empty_txt is None else empty_txt
+    if not empty_txt:
+        print(f"[INFO] No empty .txt files in {dst_dir}.")
         return
-    
+    src_index = src_index or SourceIndex.build(src_dir)
+
     new_lines = []
-    for txt_path in dst_files:
-        # Consider empty .txt files only
-        if txt_path.stat().st_size == 0 or txt_path.read_text(encoding="utf-8").strip() == "":
-            full_stem = txt_path.stem  # e.g. "book.pdf_20250524_185119"
-            base_filename = strip_timestamp_and_txt(full_stem)  # e.g. "book.pdf"
-            
-            # Find the matching source file in src_dir (allowing any extension)
-            matches = list(src_dir.rglob(base_filename))
-            if not matches:
-                continue
-            src_path = matches[0]
-
-            line = f"{base_filename} | SRC: {src_path} | TXT: {txt_path} | SRC_EXISTS: {src_path.exists()}"
-            new_lines.append(line)
-
-            print(f"Found {len(new_lines)} candidates from empty txt files")
+    for txt_path in empty_txt:
+        full_stem = txt_path.stem  # e.g. "book.pdf_20250524_185119"
+        base_filename = strip_timestamp_and_txt(full_stem)  # e.g. "book.pdf"
+
+        # Find the matching source file in src_dir (allowing any extension)
+        src_path = src_index.find_name(base_filename)
+        if src_path is None:
+            continue
+
+        line = f"{base_filename} | SRC: {src_path} | TXT: {txt_path} | SRC_EXISTS: {src_path.exists()}"
+        new_lines.append(line)
+
+    print(f"Found {len(new_lines)} candidates from empty txt files")
 
     if new_lines:
         with pending_path.open("w", encoding="utf-8") as f:  # overwrite!
@@ -206,29 +130,26 @@ def find_ocr_candidates() -> list[tuple[Path, Path, str]]:
     OCR_CANDIDATES.parent.mkdir(parents=True, exist_ok=True)
     OCRD_LOG.parent.mkdir(parents=True, exist_ok=True)
 
+    # One walk of each tree instead of a SRC_DIR.rglob() per empty .txt file
+    empty_txt = find_empty_txt(DST_DIR)
+    src_index = load_source_index(SRC_DIR, OCR_SOURCE_INDEX)
+
     # Step 1: Update pending list
-    append_missing_candidates(DST_DIR, SRC_DIR, OCR_CANDIDATES)
+    append_missing_candidates(DST_DIR, SRC_DIR, OCR_CANDIDATES, empty_txt, src_index)
 
     already_ocrd = get_already_ocrd_stems(OCRD_LOG)
 
     # Step 2: Find current empty .txt files
-    empty_txt_files = {
-        strip_timestamp_and_txt(f.stem): f
-        for f in DST_DIR.rglob("*.txt")
-        if f.stat().st_size == 0 or f.read_text(encoding="utf-8").strip() == ""
-    }
-
-    def matches(base_stem):
-        return list(SRC_DIR.rglob(base_stem + ".*"))
+    empty_txt_files = {strip_timestamp_and_txt(f.stem): f for f in empty_txt}
 
     candidates = []
 
     for base_stem, txt_file in empty_txt_files.items():
-        src_matches = matches(base_stem)
-        if not src_matches:
+        src_file = src_index.find_stem(base_stem)
+        if src_file is None:
             continue
         if base_stem not in already_ocrd:
-            candidates.append((txt_file, src_matches[0], base_stem))
+            candidates.append((txt_file, src_file, base_stem))
 
     # Step 3: Fallback if no fresh candidates
     if not candidates:
@@ -266,21 +187,34 @@ def perform_ocr_workflow(ocr_candidates: list[tuple[Path, Path, str]]):
         print("[INFO] No OCR work to perform.")
         return
 
-    replaced, skipped = 0, 0
-    for txt_file, src_file, base_stem in ocr_candidates:
+    # Files run concurrently; their pages share the OCR_WORKERS process pool (pageocr.py)
+    counts = {"replaced": 0, "skipped": 0}
+    log_lock = threading.Lock()
+
+    def process(candidate):
+        txt_file, src_file, base_stem = candidate
         print(f"[OCR] Processing {src_file}")
         text = ocr_file(src_file)
-        if text.strip():
-            txt_file.write_text(text, encoding="utf-8")
-            with OCRD_LOG.open("a", encoding="utf-8") as log_f:
-                log_f.write(f"{base_stem}\n")
-            print(f"[OCR] OCR successful → {txt_file}")
-            replaced += 1
-        else:
-            print(f"[WARN] No text extracted from {src_file}")
-            skipped += 1
+        with log_lock:
+            if text.strip():
+                txt_file.write_text(text, encoding="utf-8")
+                with OCRD_LOG.open("a", encoding="utf-8") as log_f:
+                    log_f.write(f"{base_stem}\n")
+                forget_checkpoints(src_file) # page checkpoints are only needed until the text is saved
+                print(f"[OCR] OCR successful → {txt_file}")
+                counts["replaced"] += 1
+            else:
+                print(f"[WARN] No text extracted from {src_file}")
+                counts["skipped"] += 1
+
+    print(f"[OCR] {OCR_WORKERS} OCR workers, {OCR_CONCURRENT_FILES} files at a time")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, OCR_CONCURRENT_FILES)) as files:
+            list(files.map(process, ocr_candidates))
+    finally:
+        shutdown_pool()
 
-    print(f"[OCR] Done. Replaced: {replaced}, Skipped: {skipped}")
+    print(f"[OCR] Done. Replaced: {counts['replaced']}, Skipped: {counts['skipped']}")
 
 if __name__ == "__main__":
     try:
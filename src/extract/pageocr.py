@@ -0,0 +1,372 @@
+import fitz  # PyMuPDF
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import pytesseract
+from PIL import Image
+'''
+Page-parallel OCR used by ocr.py and, with PDF_OCR_PAGES, by ingest/chunker.py. Kept free of import-time side effects (no .env paths,
+no prints) because every worker process imports it.
+    OCR_WORKERS         tesseract processes shared by all files (global budget)
+    OCR_MAX_INFLIGHT    pages rendered/queued at once across all files (caps memory)
+    OCR_CONCURRENT_FILES files perform_ocr_workflow works on at the same time
+    OCR_DPI             render resolution (0 = PyMuPDF default, 72 dpi; ddjvu default for DjVu)
+    OCR_TESSERACT_CONFIG extra tesseract flags, e.g. "--psm 6"
+    OCR_MIN_PAGE_CHARS  PDF pages with fewer non-space characters in their text layer get OCR'd
+    OCR_CHECKPOINTS     keep every finished page in OCR_CHECKPOINT_DB so an interrupted
+                        file resumes where it stopped
+Each worker renders its own page from the PDF or DjVu file, so only page numbers and text
+cross process boundaries; a DjVu page is rendered into a private temp dir that is removed
+as soon as it's OCR'd, so disk use is bounded by OCR_MAX_INFLIGHT pages. Tesseract runs single-threaded per page (OMP_THREAD_LIMIT=1):
+parallelism comes from the pages, not from OpenMP inside one page.
+'''
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+OCR_MAX_INFLIGHT = int(os.getenv("OCR_MAX_INFLIGHT", 2 * OCR_WORKERS))
+OCR_CONCURRENT_FILES = int(os.getenv("OCR_CONCURRENT_FILES", 2))
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", 50))
+OCR_DPI = int(os.getenv("OCR_DPI", 0))
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "")
+OCR_CHECKPOINTS = os.getenv("OCR_CHECKPOINTS", "true").lower() in ("1", "true", "yes")
+OCR_CHECKPOINT_DB = os.getenv("OCR_CHECKPOINT_DB", "db/ocr_checkpoints.db")
+
+_pool = None
+_pool_lock = threading.Lock()
+_inflight = threading.BoundedSemaphore(max(1, OCR_MAX_INFLIGHT))
+
+def detect_language_from_filename(file_path: Path) -> str:
+    name = file_path.name.lower()
+
+    lang_keywords = {
+        # Cyrillic and Slavic
+        "rus": "rus", "russian": "rus", "рос": "rus",
+        "ukr": "ukr", "ukrainian": "ukr",
+        # "bul": "bul", "bulgarian": "bul",
+        # "srp": "srp", "serbian": "srp",
+        # "srp_latn": "srp_latn",
+        "bel": "bel", "belarusian": "bel",
+        # "kaz": "kaz", "kazakh": "kaz",
+        # "uzb": "uzb", "uzbek": "uzb",
+        # "uzb_cyrl": "uzb_cyrl",
+        # "kir": "kir", "kyrgyz": "kir",
+        # "tgk": "tgk", "tajik": "tgk",
+        # "tat": "tat", "tatar": "tat",
+        # "mkd": "mkd", "macedonian": "mkd",
+
+        # Western languages
+        "eng": "eng", "english": "eng",
+        # "deu": "deu", "ger": "deu", "german": "deu",
+        # "fra": "fra", "fre": "fra", "french": "fra",
+        # "ita": "ita", "italian": "ita",
+        # "spa": "spa", "spanish": "spa",
+        # "por": "por", "portuguese": "por",
+        "pol": "pol", "polish": "pol", "polska": "pol",
+        # "nld": "nld", "dutch": "nld",
+        # "swe": "swe", "swedish": "swe",
+        # "dan": "dan", "danish": "dan",
+        "nor": "nor", "norwegian": "nor",
+        # "fin": "fin", "finnish": "fin",
+
+        # # Asian languages
+        # "chi_sim": "chi_sim", "zh_cn": "chi_sim", "simplified": "chi_sim",
+        # "chi_tra": "chi_tra", "zh_tw": "chi_tra", "traditional": "chi_tra",
+        # "jpn": "jpn", "japanese": "jpn",
+        # "kor": "kor", "korean": "kor",
+        # "hin": "hin", "hindi": "hin",
+        # "tam": "tam", "tamil": "tam",
+        # "tel": "tel", "telugu": "tel",
+        # "kan": "kan", "kannada": "kan",
+        # "mal": "mal", "malayalam": "mal",
+        # "mya": "mya", "burmese": "mya",
+        # "tha": "tha", "thai": "tha",
+        # "vie": "vie", "vietnamese": "vie",
+
+        # Others
+        # "ara": "ara", "arabic": "ara",
+        # "heb": "heb", "hebrew": "heb",
+        # "grc": "grc", "greek": "ell",
+        # "ell": "ell", "modern_greek": "ell",
+        # "amh": "amh", "ethiopic": "amh",
+        # "ben": "ben", "bengali": "ben",
+        # "guj": "guj", "gujarati": "guj",
+        # "pan": "pan", "punjabi": "pan",
+        # "urd": "urd", "urdu": "urd",
+        # "syr": "syr", "syriac": "syr",
+        # "san": "san", "sanskrit": "san",
+        # "nep": "nep", "nepali": "nep",
+    }
+
+    for key, lang in lang_keywords.items():
+        if key in name:
+            return lang
+    return "eng"  # default fallback
+
+# === Worker side ===
+_docs = {} # path -> open fitz.Document, per worker process
+_MAX_OPEN_DOCS = 4
+
+def _init_worker():
+    # Inherited by the tesseract subprocesses pytesseract starts
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def _ready(hold: float = 0.0) -> bool:
+    time.sleep(hold) # keeps this worker busy so the next warm-up task needs another one
+    return True
+
+def _open_pdf(path: str):
+    doc = _docs.get(path)
+    if doc is None:
+        if len(_docs) >= _MAX_OPEN_DOCS:
+            _docs.pop(next(iter(_docs))).close()
+        doc = _docs[path] = fitz.open(path)
+    return doc
+
+def ocr_pdf_page(path: str, page_number: int, lang: str = "eng") -> str:
+    page = _open_pdf(path)[page_number]
+    pixmap = page.get_pixmap(dpi=OCR_DPI, alpha=False) if OCR_DPI else page.get_pixmap(alpha=False)
+    image = Image.open(io.BytesIO(pixmap.tobytes()))
+    return pytesseract.image_to_string(image, lang=lang, config=OCR_TESSERACT_CONFIG)
+
+def ocr_djvu_page(path: str, page_number: int, lang: str = "eng") -> str:
+    with tempfile.TemporaryDirectory(prefix="ocr-djvu-") as tmp:
+        image_path = os.path.join(tmp, "page.tif")
+        cmd = ["ddjvu", "-format=tiff", f"-page={page_number + 1}"] # ddjvu pages are 1-based
+        if OCR_DPI:
+            cmd.append(f"-scale={OCR_DPI}")
+        subprocess.run(cmd + [path, image_path], check=True, capture_output=True)
+        with Image.open(image_path) as image:
+            return pytesseract.image_to_string(image, lang=lang, config=OCR_TESSERACT_CONFIG)
+
+def ocr_image(path: str, lang: str = "eng") -> str:
+    return pytesseract.image_to_string(Image.open(path), lang=lang, config=OCR_TESSERACT_CONFIG)
+
+# === Page checkpoints ===
+def settings_key(kind: str = "pdf") -> str:
+    """Everything besides source and language that changes a page's OCR text.
+    Pages cached under other settings are simply not matched."""
+    settings = {"kind": kind, "dpi": OCR_DPI, "config": OCR_TESSERACT_CONFIG}
+    return hashlib.blake2b(json.dumps(settings, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+def source_hash(path) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class PageCheckpoints:
+    """OCR text of finished pages, keyed by (source hash, page, lang, settings key).
+    Pages are written as soon as tesseract returns them."""
+    def __init__(self, path=OCR_CHECKPOINT_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_pages (
+                src_hash TEXT,
+                page INTEGER,
+                lang TEXT,
+                settings TEXT,
+                text TEXT,
+                created REAL,
+                PRIMARY KEY (src_hash, page, lang, settings)
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, src_hash: str, lang: str, settings: str) -> dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM ocr_pages WHERE src_hash = ? AND lang = ? AND settings = ?",
+                (src_hash, lang, settings)).fetchall()
+        return dict(rows)
+
+    def put(self, src_hash: str, page: int, lang: str, settings: str, text: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (src_hash, page, lang, settings, text, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (src_hash, page, lang, settings, text, time.time()))
+            self._conn.commit()
+
+    def forget(self, src_hash: str):
+        # Called once the whole file's text has been written out
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_pages WHERE src_hash = ?", (src_hash,))
+            self._conn.commit()
+
+_checkpoints = None
+
+def get_checkpoints() -> PageCheckpoints | None:
+    global _checkpoints
+    if not OCR_CHECKPOINTS:
+        return None
+    with _pool_lock:
+        if _checkpoints is None:
+            _checkpoints = PageCheckpoints()
+        return _checkpoints
+
+# === Caller side ===
+def get_pool() -> ProcessPoolExecutor:
+    """Shared OCR process pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, OCR_WORKERS), initializer=_init_worker)
+            # Start every worker now, before callers start submitting from several threads.
+            # The executor adds a process only when no worker is idle (always, for non-fork
+            # start methods), so one busy warm-up task per worker is needed to start them all.
+            warm_up = [_pool.submit(_ready, 0.05) for _ in range(max(1, OCR_WORKERS))]
+            for future in warm_up:
+                future.result()
+        return _pool
+
+def set_pool_size(workers: int):
+    """Set OCR_WORKERS (and OCR_MAX_INFLIGHT, unless it is set in the environment)
+    before the pool starts, for processes that each run their own pool."""
+    global OCR_WORKERS, OCR_MAX_INFLIGHT, _inflight
+    with _pool_lock:
+        if _pool is not None or workers == OCR_WORKERS:
+            return
+        OCR_WORKERS = max(1, workers)
+        if "OCR_MAX_INFLIGHT" not in os.environ:
+            OCR_MAX_INFLIGHT = 2 * OCR_WORKERS
+            _inflight = threading.BoundedSemaphore(OCR_MAX_INFLIGHT)
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def submit(fn, *args):
+    """Submit an OCR task, blocking while OCR_MAX_INFLIGHT tasks are already queued."""
+    _inflight.acquire()
+    try:
+        future = get_pool().submit(fn, *args)
+    except BaseException:
+        _inflight.release()
+        raise
+    future.add_done_callback(lambda _: _inflight.release())
+    return future
+
+def pdf_page_count(path) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+def djvu_page_count(path) -> int:
+    out = subprocess.run(["djvused", "-e", "n", str(path)], check=True, capture_output=True, text=True)
+    return int(out.stdout.strip())
+
+# kind -> (page count, worker task)
+_PAGE_SOURCES = {
+    "pdf": (pdf_page_count, ocr_pdf_page),
+    "djvu": (djvu_page_count, ocr_djvu_page),
+}
+
+class _Done:
+    # Stand-in future for a page read from the checkpoint DB
+    def __init__(self, text: str):
+        self.text = text
+    def done(self) -> bool:
+        return True
+    def result(self) -> str:
+        return self.text
+
+def _checkpointed(future, checkpoints, key: tuple, page_number: int):
+    src_hash, lang, settings = key
+    def save(done):
+        if not done.cancelled() and done.exception() is None:
+            checkpoints.put(src_hash, page_number, lang, settings, done.result())
+    future.add_done_callback(save)
+    return future
+
+def ocr_pages(path, lang: str = "eng", kind: str = "pdf", pages=None, src_hash: str = None) -> Iterator[tuple[int, str]]:
+    """Yield (page_number, text) in page order while later pages are still being OCR'd.
+    kind is "pdf" or "djvu". With checkpoints enabled, pages finished by an earlier
+    (interrupted) run are reused."""
+    path = str(path)
+    page_count, task = _PAGE_SOURCES[kind]
+    pages = range(page_count(path)) if pages is None else pages
+    checkpoints = get_checkpoints()
+    done, key = {}, None
+    if checkpoints:
+        key = (src_hash or source_hash(path), lang, settings_key(kind))
+        done = checkpoints.get(*key)
+        if done:
+            print(f"[OCR] Resuming {os.path.basename(path)}: {len(done)} pages already done")
+
+    pending = deque()
+    for page_number in pages:
+        # Drain finished pages first so one big file can't hold every in-flight slot
+        while pending and pending[0][1].done():
+            number, future = pending.popleft()
+            yield number, future.result()
+        if page_number in done:
+            pending.append((page_number, _Done(done[page_number])))
+            continue
+        future = submit(task, path, page_number, lang)
+        if checkpoints:
+            _checkpointed(future, checkpoints, key, page_number)
+        pending.append((page_number, future))
+    while pending:
+        number, future = pending.popleft()
+        yield number, future.result()
+
+def ocr_pdf_pages(path, lang: str = "eng", pages=None, src_hash: str = None) -> Iterator[tuple[int, str]]:
+    return ocr_pages(path, lang, "pdf", pages, src_hash)
+
+def ocr_djvu_pages(path, lang: str = "eng", pages=None, src_hash: str = None) -> Iterator[tuple[int, str]]:
+    return ocr_pages(path, lang, "djvu", pages, src_hash)
+
+def ocr_pdf(path, lang: str = "eng") -> str:
+    return "\n\n".join(text for _, text in ocr_pdf_pages(path, lang))
+
+def ocr_djvu(path, lang: str = "eng") -> str:
+    return "\n\n".join(text for _, text in ocr_djvu_pages(path, lang))
+
+def forget_checkpoints(path):
+    """Drop the cached pages of a file whose full text has been saved."""
+    checkpoints = get_checkpoints()
+    if checkpoints:
+        checkpoints.forget(source_hash(path))
+
+# === Selective OCR ===
+def needs_ocr(text: str, min_chars: int = OCR_MIN_PAGE_CHARS) -> bool:
+    return len("".join(text.split())) < min_chars
+
+def pdf_pages_with_ocr(path, lang: str = "eng", min_chars: int = OCR_MIN_PAGE_CHARS,
+                       drop_checkpoints: bool = False) -> Iterator[tuple[int, str]]:
+    """Yield (page_number, text) for every page: the native text layer where it has at
+    least min_chars characters, OCR otherwise (scanned inserts, image-only pages).
+    drop_checkpoints forgets the OCR'd pages once the last page has been consumed,
+    for callers that don't write the text out themselves (ingest.chunker)."""
+    with fitz.open(str(path)) as doc:
+        # Only the page numbers are kept from this pass, so a huge PDF's text is never all in memory;
+        # native pages are extracted again below, in order, as they are consumed
+        scanned = [i for i, page in enumerate(doc) if needs_ocr(page.get_text(), min_chars)]
+        src_hash = None
+        if scanned:
+            print(f"[OCR] {os.path.basename(str(path))}: {len(scanned)}/{doc.page_count} pages without a text layer")
+            src_hash = source_hash(path) if get_checkpoints() else None # hashed once, for resume and forget
+        ocred = ocr_pdf_pages(path, lang, pages=scanned, src_hash=src_hash)
+        scanned = set(scanned)
+        for page_number, page in enumerate(doc):
+            yield next(ocred) if page_number in scanned else (page_number, page.get_text())
+    if drop_checkpoints and src_hash:
+        get_checkpoints().forget(src_hash)
+
+def pdf_text_with_ocr(path, lang: str = "eng", min_chars: int = OCR_MIN_PAGE_CHARS) -> str:
+    return "\n\n".join(text for _, text in pdf_pages_with_ocr(path, lang, min_chars))
@@ -0,0 +1,117 @@
+import json
+import os
+from pathlib import Path
+'''
+One-pass indexes used by ocr.py to find OCR candidates without a directory walk per file.
+    SourceIndex      name / dotted-prefix -> source path for every file under SRC_DIR
+    find_empty_txt   every .txt under DST_DIR with no text, checked from size and a prefix read
+A SourceIndex can be persisted as JSON (OCR_SOURCE_INDEX in .env); it is reused as long as
+no directory under SRC_DIR has changed (adding, removing or renaming a file updates the
+mtime of its directory).
+'''
+EMPTY_PREFIX_BYTES = 4096
+
+def _walk(root: Path):
+    # Sorted so the first match is stable between runs
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        yield dirpath, sorted(filenames)
+
+def is_empty_text(path, size: int = None) -> bool:
+    """True if the file has no non-whitespace text. Only reads past the first
+    EMPTY_PREFIX_BYTES when those are all whitespace."""
+    if size is None:
+        size = os.stat(path).st_size
+    if size == 0:
+        return True
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(EMPTY_PREFIX_BYTES), b""):
+            if block.decode("utf-8", errors="ignore").strip():
+                return False
+    return True
+
+def find_empty_txt(dst_dir: Path) -> list[Path]:
+    empty = []
+    for dirpath, filenames in _walk(dst_dir):
+        for name in filenames:
+            if name.endswith(".txt"):
+                path = os.path.join(dirpath, name)
+                if is_empty_text(path):
+                    empty.append(Path(path))
+    return sorted(empty)
+
+class SourceIndex:
+    """
+    Every file under root, by exact name ("book.pdf") and by each dotted prefix of the
+    name ("book" for "book.pdf", "book" and "book.tar" for "book.tar.gz"). The first file
+    in walk order wins, as with rglob()[0].
+    """
+    def __init__(self, root: Path, by_name: dict, by_prefix: dict, dirs: dict):
+        self.root = Path(root)
+        self.by_name = by_name
+        self.by_prefix = by_prefix
+        self.dirs = dirs # dir -> mtime_ns at build time
+
+    @classmethod
+    def build(cls, root: Path) -> "SourceIndex":
+        by_name, by_prefix, dirs = {}, {}, {}
+        for dirpath, filenames in _walk(root):
+            dirs[dirpath] = os.stat(dirpath).st_mtime_ns
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                by_name.setdefault(name, path)
+                dot = name.find(".", 1)
+                while dot != -1:
+                    by_prefix.setdefault(name[:dot], path)
+                    dot = name.find(".", dot + 1)
+        return cls(root, by_name, by_prefix, dirs)
+
+    def find_name(self, name: str) -> Path | None:
+        # Same file as src_dir.rglob(name)
+        path = self.by_name.get(name)
+        return Path(path) if path else None
+
+    def find_stem(self, stem: str) -> Path | None:
+        # Same file as src_dir.rglob(stem + ".*")
+        path = self.by_prefix.get(stem)
+        return Path(path) if path else None
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def is_current(self) -> bool:
+        for dirpath, mtime_ns in self.dirs.items():
+            try:
+                if os.stat(dirpath).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"root": str(self.root), "by_name": self.by_name, "by_prefix": self.by_prefix, "dirs": self.dirs}
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "SourceIndex | None":
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(data["root"], data["by_name"], data["by_prefix"], data["dirs"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+def load_source_index(src_dir: Path, cache_path: Path = None) -> SourceIndex:
+    """Reuse the index persisted at cache_path if SRC_DIR hasn't changed, else rebuild it."""
+    if cache_path:
+        index = SourceIndex.load(cache_path)
+        if index and index.root == Path(src_dir) and index.is_current():
+            print(f"[INFO] Source index reused: {len(index)} files ({cache_path})")
+            return index
+    index = SourceIndex.build(src_dir)
+    print(f"[INFO] Source index built: {len(index)} files in {len(index.dirs)} dirs")
+    if cache_path:
+        index.save(cache_path)
+    return index
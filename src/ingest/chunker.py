@@ -1,8 +1,10 @@
 import os
+import re
 import shutil
 import subprocess
 import tempfile
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from langchain_community.document_loaders import (
     PyPDFLoader, UnstructuredMarkdownLoader, UnstructuredWordDocumentLoader,
@@ -14,9 +16,9 @@ from striprtf.striprtf import rtf_to_text
 from unstructured.partition.doc import partition_doc
 from unstructured.partition.html import partition_html
 
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import CHUNK_SIZE, CHUNK_OVERLAP, PDF_OCR_PAGES, PDF_OCR_WORKERS
 from data.filter import clean_text
-from data.jsonhandler import load_normalization_map, apply_normalization, detect_potential_ocr_errors
+from data.jsonhandler import detect_potential_ocr_errors
 
 # === Custom Safe Loader for .txt ===
 class SafeTextLoader(TextLoader):
@@ -27,6 +29,24 @@ class SafeTextLoader(TextLoader):
 splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
 
 # === Chunking Logic ===
+def _log_ocr_fixes(ocr_fixes: dict[str, str]):
+    if not ocr_fixes:
+        return
+    log_dir = "logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    log_filename = f"ocr_artifacts_{timestamp}.txt"
+    log_path = os.path.join("logs", log_filename)
+
+    with open(log_path, "a", encoding="utf-8") as f:
+        for bad, good in sorted(ocr_fixes.items()):
+            log_msg = f"[OCR] Suggest fix: '{bad}' → '{good}'"
+            print(log_msg)
+            f.write(log_msg + "\n")
+            print(f"[LOG] Added to log: {log_msg}")
+
 def split_into_chunks(text: str, update_map: bool = False) -> list[str]:
     print("[DEBUG] Starting split_into_chunks")
     cleaned = clean_text(text)
@@ -36,29 +56,72 @@ def split_into_chunks(text: str, update_map: bool = False) -> list[str]:
         print("[DEBUG] Detecting OCR artifacts (logging only, no map update)")
         ocr_fixes = detect_potential_ocr_errors(cleaned)
         print(f"[DEBUG] Found {len(ocr_fixes)} OCR fixes")
+        _log_ocr_fixes(ocr_fixes)
+
+    # Normalization rules (including updated fixes) were applied by clean_text
 
-        if ocr_fixes:
-            log_dir = "logs"
-            os.makedirs(log_dir, exist_ok=True)
+    print("[DEBUG] Splitting with text splitter")
+    return [doc.page_content for doc in splitter.split_documents([Document(page_content=cleaned)])]
 
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-            log_filename = f"ocr_artifacts_{timestamp}.txt"
-            log_path = os.path.join("logs", log_filename)
+_OCR_WORD = re.compile(r"\b[a-zA-Z]{4,}\b") # same words detect_potential_ocr_errors checks
 
-            with open(log_path, "a", encoding="utf-8") as f:
-                for bad, good in sorted(ocr_fixes.items()):
-                    log_msg = f"[OCR] Suggest fix: '{bad}' → '{good}'"
-                    print(log_msg)
-                    f.write(log_msg + "\n")
-                    print(f"[LOG] Added to log: {log_msg}")
+def _join_pages(tail: str, text: str) -> str:
+    # The page break gets the same treatment clean_text gives an inline line break
+    if not tail or not text:
+        return tail or text
+    sep = "\n" if tail[-1] in ".?!" or "A" <= text[0] <= "Z" else " "
+    return tail + sep + text
 
-    # Apply Normalization Rules (includes updated fixes)
-    norm_map = load_normalization_map()
-    normalized = apply_normalization(cleaned, norm_map)
+def _page_at(spans: list, pos: int):
+    # Page of the last span starting at or before pos
+    page = spans[0][1] if spans else None
+    for offset, span_page in spans:
+        if offset > pos:
+            break
+        page = span_page
+    return page
 
-    print("[DEBUG] Splitting with text splitter")
-    return [doc.page_content for doc in splitter.split_documents([Document(page_content=cleaned)])]
+def split_pages(pages: Iterable[Document], update_map: bool = False) -> Iterator[tuple[str, int | None]]:
+    """Clean and split a document page by page, yielding (chunk, page) where page is the
+    metadata["page"] the chunk starts on (None for loaders without pages).
+    The last chunk of every page is carried over and re-split with the next page, so
+    overlap crosses page boundaries and only about one page of text is held at a time."""
+    tail, spans = "", [] # spans: (offset in tail, page) where each page's text starts
+    words = set()
+    for page in pages:
+        text = clean_text(page.page_content, verbose=False)
+        if not text:
+            continue
+        if update_map:
+            words.update(_OCR_WORD.findall(text))
+        tail = _join_pages(tail, text)
+        spans.append((len(tail) - len(text), page.metadata.get("page")))
+
+        chunks = splitter.split_text(tail)
+        if len(chunks) < 2:
+            continue
+        pos = -1
+        for chunk in chunks[:-1]:
+            found = tail.find(chunk, pos + 1)
+            pos = found if found >= 0 else max(pos, 0)
+            yield chunk, _page_at(spans, pos)
+        # Keep the last (possibly incomplete) chunk and re-split it with the next page
+        cut = tail.find(chunks[-1], pos + 1)
+        cut = cut if cut >= 0 else len(tail) - len(chunks[-1])
+        spans = [(0, _page_at(spans, cut))] + [(offset - cut, p) for offset, p in spans if offset > cut]
+        tail = tail[cut:]
+
+    pos = -1
+    for chunk in splitter.split_text(tail):
+        found = tail.find(chunk, pos + 1)
+        pos = found if found >= 0 else max(pos, 0)
+        yield chunk, _page_at(spans, pos)
+
+    if update_map and words:
+        print("[DEBUG] Detecting OCR artifacts (logging only, no map update)")
+        ocr_fixes = detect_potential_ocr_errors(" ".join(sorted(words)))
+        print(f"[DEBUG] Found {len(ocr_fixes)} OCR fixes")
+        _log_ocr_fixes(ocr_fixes)
 
 # === Loaders ===
 
@@ -84,7 +147,7 @@ class DidjvuLoader:
     def __init__(self, file_path: str):
         self.file_path = file_path
 
-    def load(self) -> list[Document]:
+    def _check(self):
         if not shutil.which("djvutxt"):
             raise EnvironmentError("djvutxt is not installed. sudo apt install djvulibre-bin")
         
@@ -93,6 +156,39 @@ class DidjvuLoader:
         if not djvu_path.exists():
             raise FileNotFoundError(f"DjVu file not found: {self.file_path}")
 
+    def lazy_load(self) -> Iterator[Document]:
+        # djvutxt ends every page with a form feed; read its output one page at a time.
+        # stderr goes to a temporary file: an unread pipe could fill up and block djvutxt.
+        self._check()
+        with tempfile.TemporaryFile(mode="w+") as errors:
+            proc = subprocess.Popen(["djvutxt", self.file_path], stdout=subprocess.PIPE,
+                                    stderr=errors, text=True)
+            page, buf = 1, []
+            finished = False
+            try:
+                for line in proc.stdout:
+                    while "\f" in line:
+                        head, line = line.split("\f", 1)
+                        buf.append(head)
+                        yield Document(page_content="".join(buf), metadata={"page": page})
+                        page, buf = page + 1, []
+                    buf.append(line)
+                if "".join(buf).strip():
+                    yield Document(page_content="".join(buf), metadata={"page": page})
+                finished = True
+            finally:
+                if not finished and proc.poll() is None:
+                    proc.kill() # consumer stopped early or failed: the rest of the output isn't wanted
+                proc.stdout.close()
+                proc.wait()
+            # Only a complete read is checked, so errors above and early closes are not masked
+            if proc.returncode != 0:
+                errors.seek(0)
+                raise RuntimeError(f"djvutxt failed: {errors.read()}")
+
+    def load(self) -> list[Document]:
+        self._check()
+
         try:
             # Extract text using djvutxt
             result = subprocess.run(
@@ -181,19 +277,42 @@ class PyPDFLoaderWithPassword(PyPDFLoader):
         super().__init__(file_path)
         self.password = password
 
-    def load(self) -> list[Document]:
+    def lazy_load(self) -> Iterator[Document]:
+        # One page extracted at a time; page numbers are 1-based as shown in viewers
         reader = PdfReader(self.file_path, password=self.password)
-        texts = [page.extract_text() or "" for page in reader.pages]
+        for number, page in enumerate(reader.pages, start=1):
+            yield Document(page_content=page.extract_text() or "", metadata={"page": number})
+
+    def load(self) -> list[Document]:
+        texts = [doc.page_content for doc in self.lazy_load()]
         return [Document(page_content="\n".join(texts))]
 
+# --- .pdf loader: native text layer, OCR for pages without one (extract/pageocr.py) ---
+class SelectiveOCRPDFLoader:
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        # Imported here so PyMuPDF/tesseract are only needed when PDF_OCR_PAGES is on
+        from extract.pageocr import detect_language_from_filename, pdf_pages_with_ocr, set_pool_size
+        set_pool_size(PDF_OCR_WORKERS) # one pool per ingest worker process
+        lang = detect_language_from_filename(Path(self.file_path))
+        # Page checkpoints are dropped once the last page is read: the chunks are stored in metadata.db
+        for page_number, text in pdf_pages_with_ocr(self.file_path, lang, drop_checkpoints=True):
+            yield Document(page_content=text, metadata={"page": page_number + 1})
+
+    def load(self) -> list[Document]:
+        return [Document(page_content="\n\n".join(doc.page_content for doc in self.lazy_load()))]
+
 # === Loader Dispatcher ===
-def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Document] | None:
+def get_loader(file_path: str, pdf_password: str = None):
     ext = os.path.splitext(file_path)[-1].lower()
 
-    if ext == ".pdf":
-        loader = PyPDFLoaderWithPassword(file_path, password=pdf_password)
-    else:
-        loader_map = {
+    if ext == ".pdf" and PDF_OCR_PAGES and not pdf_password:
+        return SelectiveOCRPDFLoader(file_path)
+    elif ext == ".pdf":
+        return PyPDFLoaderWithPassword(file_path, password=pdf_password)
+    loader_map = {
         # ".pdf": PyPDFLoaderWithPassword, # PyPDFLoader replaced to fix pypdf/_encryption.py
         ".txt": SafeTextLoader,
         ".md": UnstructuredMarkdownLoader,
@@ -206,13 +325,30 @@ def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Docum
         ".html": UnstructuredHTMLLoader,
         ".htm": UnstructuredHTMLLoader,
         ".mobi": MOBILoader,  # custom MOBI loader using Calibre conversion
-        }
-        loader_cls = loader_map.get(ext)
-        if loader_cls is None:          
-            return None
-        loader = loader_cls(file_path)
+    }
+    loader_cls = loader_map.get(ext)
+    return loader_cls(file_path) if loader_cls else None
+
+def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Document] | None:
+    loader = get_loader(file_path, pdf_password)
+    if loader is None:
+        return None
     try:
         return loader.load()
     except Exception as e:
         print(f"[ERROR] Failed to load {file_path}: {e}")
         return []
+
+def iter_pages(file_path: str, pdf_password: str = None) -> Iterator[Document] | None:
+    """Lazy version of detect_and_load_text: PDF and DjVu pages are read one at a time
+    (with metadata["page"]); loaders without lazy_load yield what load() returns.
+    Load errors are raised while iterating."""
+    loader = get_loader(file_path, pdf_password)
+    if loader is None:
+        return None
+    if hasattr(loader, "lazy_load"):
+        return loader.lazy_load()
+    return _load_all(loader)
+
+def _load_all(loader) -> Iterator[Document]:
+    yield from loader.load()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from config import (ANSWER_CACHE, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY,
+                    ANSWER_CACHE_TTL_HOURS)
+from data import get_index_version
+
+'''
+Persistent cache of generated answers (db/answer_cache.db).
+An exact hit needs the same normalized question, the same retrieved chunk ids (in order),
+the same model and sampling params and the same index version. With ANSWER_CACHE_SIMILARITY
+set, a question whose embedding is close enough to a cached one for the same model,
+params and index version is also served from the cache.
+Entries of other index versions are dropped as soon as the index changes.
+'''
+CACHE_PATH = Path("db/answer_cache.db")
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """
+    SQLite answer cache with a TTL and least-recently-used eviction above max_entries.
+    """
+    def __init__(self, path: Path = CACHE_PATH, ttl_hours: float = ANSWER_CACHE_TTL_HOURS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.ttl = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index_version = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                scope TEXT,
+                index_version TEXT,
+                question TEXT,
+                vector BLOB,
+                answer TEXT,
+                sources TEXT,
+                created REAL,
+                last_used REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers(scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_lru ON answers(last_used)")
+        self._conn.commit()
+
+    def _current_version(self) -> str:
+        # Drop every entry built against another index as soon as the index changes
+        version = get_index_version()
+        if version != self._index_version:
+            deleted = self._conn.execute(
+                "DELETE FROM answers WHERE index_version != ?", (version,)).rowcount
+            self._conn.commit()
+            if deleted and self._index_version is not None:
+                print(f"[AnswerCache] Index changed, dropped {deleted} cached answers.")
+            self._index_version = version
+        return version
+
+    def _keys(self, question: str, chunk_ids: List, generation: dict):
+        version = self._current_version()
+        scope = _digest(generation, version)
+        return _digest(normalize_question(question), list(chunk_ids), scope), scope, version
+
+    def lookup(self, question: str, chunk_ids: List, generation: dict,
+               question_vector: Optional[List[float]] = None) -> Optional[dict]:
+        """
+        Return {"answer", "sources", "match"} for a cached answer, or None.
+        Args:
+            question (str): The user question.
+            chunk_ids (List): Ids of the retrieved chunks, in prompt order.
+            generation (dict): Model path, sampling params and prompt (llm.generation_signature).
+            question_vector (List[float]): Question embedding, enables the similarity lookup.
+        """
+        now = time.time()
+        with self._lock:
+            key, scope, _ = self._keys(question, chunk_ids, generation)
+            row = self._conn.execute(
+                "SELECT key, answer, sources FROM answers WHERE key = ? AND created > ?",
+                (key, now - self.ttl)).fetchone()
+            match = "exact"
+            if row is None and question_vector is not None and self.similarity > 0:
+                row, match = self._similar(scope, question_vector, now), "similar"
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            self.hits += 1
+        return {"answer": row[1], "sources": row[2], "match": match}
+
+    def _similar(self, scope: str, question_vector: List[float], now: float):
+        rows = self._conn.execute(
+            "SELECT key, answer, sources, vector FROM answers WHERE scope = ? AND vector IS NOT NULL AND created > ?",
+            (scope, now - self.ttl)).fetchall()
+        if not rows:
+            return None
+        query = np.asarray(question_vector, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        best = int(np.argmax(scores))
+        return rows[best][:3] if scores[best] >= self.similarity else None
+
+    def store(self, question: str, chunk_ids: List, generation: dict, answer: str, sources: str,
+              question_vector: Optional[List[float]] = None):
+        now = time.time()
+        vector = None if question_vector is None else np.asarray(question_vector, dtype=np.float32).tobytes()
+        with self._lock:
+            key, scope, version = self._keys(question, chunk_ids, generation)
+            self._conn.execute('''
+                INSERT OR REPLACE INTO answers
+                    (key, scope, index_version, question, vector, answer, sources, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, scope, version, question, vector, answer, sources, now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl,))
+        size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if size > self.max_entries:
+            self._conn.execute('''
+                DELETE FROM answers WHERE key IN (
+                    SELECT key FROM answers ORDER BY last_used LIMIT ?
+                )
+            ''', (size - self.max_entries,))
+
+    def record(self, tokens: Iterator[str], question: str, chunk_ids: List, generation: dict,
+               sources: str, question_vector: Optional[List[float]] = None) -> Iterator[str]:
+        """Pass tokens through and cache the full answer once generation completes.
+        Answers abandoned midway (or failed) are not cached."""
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield token
+        answer = "".join(parts)
+        if answer.strip():
+            self.store(question, chunk_ids, generation, answer, sources, question_vector)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"[AnswerCache] {self.hits} hits / {self.misses} misses ({rate:.1f}% hit rate)"
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide AnswerCache, or None when ANSWER_CACHE is disabled."""
+    global _answer_cache
+    if not ANSWER_CACHE:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
@@ -0,0 +1,140 @@
+from typing import Callable, List, Optional
+
+from langchain.schema import Document
+
+from config import CHUNK_OVERLAP
+
+'''
+Token-budgeted context packing. Retrieved chunks are taken in relevance order; a chunk whose
+chunk_index neighbour of the same document is already packed is merged into that span with the
+repeated CHUNK_OVERLAP text removed, and chunks that no longer fit in the budget are skipped.
+Token counts come from the model's own tokenizer (llm.count_tokens).
+'''
+
+def overlap_length(left: str, right: str, max_overlap: int = CHUNK_OVERLAP) -> int:
+    """Length of the longest suffix of left that is also a prefix of right, on word
+    boundaries and at most max_overlap characters (what the text splitter repeats)."""
+    for k in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:k]) \
+                and (k == len(left) or left[-k - 1].isspace()) \
+                and (k == len(right) or right[k].isspace()):
+            return k
+    return 0
+
+def join_chunks(left: str, right: str, max_overlap: int = CHUNK_OVERLAP) -> str:
+    k = overlap_length(left, right, max_overlap)
+    rest = right[k:].lstrip()
+    return left + " " + rest if rest else left
+
+class Span:
+    """Consecutive chunks of one document, packed as a single context block."""
+    def __init__(self, doc: Document, rank: int):
+        self.doc_key = _doc_key(doc)
+        self.docs = [doc]
+        self.rank = rank # best (lowest) retrieval rank of its chunks
+        self.text = doc.page_content
+
+    @property
+    def first(self) -> Optional[int]:
+        return self.docs[0].metadata.get("chunk_index")
+
+    @property
+    def last(self) -> Optional[int]:
+        return self.docs[-1].metadata.get("chunk_index")
+
+    def contains(self, key, index: int) -> bool:
+        return self.doc_key == key and self.first is not None and self.first <= index <= self.last
+
+    def touches(self, key, index: int) -> bool:
+        return self.doc_key == key and self.first is not None and index in (self.first - 1, self.last + 1)
+
+    def extended(self, doc: Document) -> str:
+        # Text after adding doc at either end
+        index = doc.metadata.get("chunk_index")
+        if index == self.last + 1:
+            return join_chunks(self.text, doc.page_content)
+        return join_chunks(doc.page_content, self.text)
+
+    def add(self, doc: Document, text: str):
+        if doc.metadata.get("chunk_index") == self.last + 1:
+            self.docs.append(doc)
+        else:
+            self.docs.insert(0, doc)
+        self.text = text
+
+    def merge(self, other: "Span", text: str):
+        # other directly follows self
+        self.docs.extend(other.docs)
+        self.rank = min(self.rank, other.rank)
+        self.text = text
+
+    def to_document(self) -> Document:
+        metadata = dict(self.docs[0].metadata)
+        metadata["chunk_indexes"] = [d.metadata.get("chunk_index") for d in self.docs]
+        metadata["chunk_ids"] = [d.metadata.get("chunk_id") for d in self.docs]
+        return Document(page_content=self.text, metadata=metadata)
+
+def _doc_key(doc: Document):
+    md = doc.metadata or {}
+    return md.get("doc_id") or md.get("path")
+
+def pack_context(docs: List[Document], count_tokens: Callable[[str], int], budget: Optional[int] = None,
+                 block_overhead: int = 8) -> List[Document]:
+    """
+    Merge and budget retrieved chunks for the prompt.
+    Args:
+        docs (List[Document]): Retrieved chunks, most relevant first.
+        count_tokens (Callable): Token counter of the model that will read the prompt.
+        budget (int): Max context tokens; None packs every chunk (merging only),
+            0 or less packs nothing (the prompt already fills the window).
+        block_overhead (int): Tokens reserved per block for its [title—chunk] tag.
+    Returns:
+        List[Document]: One Document per span, in relevance order, with the merged text and
+        metadata["chunk_indexes"] / ["chunk_ids"] of the chunks it contains.
+    """
+    spans: List[Span] = []
+    used = 0
+    skipped = 0
+    for rank, doc in enumerate(docs):
+        key, index = _doc_key(doc), doc.metadata.get("chunk_index")
+        if index is None or key is None:
+            neighbours = []
+        else:
+            # A chunk already packed (returned twice by hybrid search) costs nothing
+            if any(s.contains(key, index) for s in spans):
+                continue
+            neighbours = [s for s in spans if s.touches(key, index)]
+
+        if not neighbours:
+            cost = count_tokens(doc.page_content) + block_overhead
+            if budget is not None and used + cost > budget:
+                skipped += 1
+                continue
+            spans.append(Span(doc, rank))
+            used += cost
+            continue
+
+        # Extend the neighbouring span (or bridge two spans); only the new text is counted
+        span = neighbours[0]
+        text = span.extended(doc)
+        if len(neighbours) == 2:
+            before, after = sorted(neighbours, key=lambda s: s.first)
+            text = join_chunks(join_chunks(before.text, doc.page_content), after.text)
+            new_tokens = count_tokens(text) - count_tokens(before.text) - count_tokens(after.text) - block_overhead
+        else:
+            new_tokens = count_tokens(text) - count_tokens(span.text)
+        if budget is not None and used + new_tokens > budget:
+            skipped += 1
+            continue
+        used += new_tokens
+        if len(neighbours) == 2:
+            before.add(doc, join_chunks(before.text, doc.page_content))
+            before.merge(after, text)
+            spans.remove(after)
+        else:
+            span.add(doc, text)
+
+    if skipped:
+        print(f"[Context] {skipped} chunks left out to stay within {budget} tokens")
+    spans.sort(key=lambda s: s.rank)
+    return [span.to_document() for span in spans]
@@ -0,0 +1,79 @@
+from collections.abc import Mapping
+from typing import Dict, List, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+from data import get_chunks_by_ids
+
+'''
+Lazy FAISS docstore backed by metadata.db. Chunk text and metadata already live in the
+SQLite chunks/documents tables, so instead of pickling a second copy into index.pkl, FAISS
+results are resolved by chunks.id at query time. The position -> chunk id map is saved as
+index_ids.npy and can be memory-mapped along with index.faiss; labelled (IVF) indexes
+return chunk ids directly and need no map (ChunkLabelMap).
+'''
+
+def chunk_to_document(row: dict) -> Document:
+    return Document(
+        page_content=row["content"],
+        metadata={
+            "doc_id": row["doc_id"],
+            "chunk_id": row["chunk_id"],
+            "path": row["path"],
+            "title": row["title"],
+            "chunk_index": row["chunk_index"],
+            "page": row.get("page") or "?",
+        },
+    )
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Read-through docstore: SQLite is the source of truth, so add/delete are no-ops."""
+
+    def search(self, search: str) -> Union[str, Document]:
+        chunk_id = int(search)
+        row = get_chunks_by_ids([chunk_id]).get(chunk_id)
+        if row is None:
+            # Vector of a deleted chunk not yet compacted away; TombstoneFilter drops it
+            return Document(page_content="", metadata={"chunk_id": chunk_id, "deleted": True})
+        return chunk_to_document(row)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        pass # rows were inserted by know.retriever before embedding
+
+    def delete(self, ids: List) -> None:
+        pass # rows were deleted by data.db.delete_document
+
+class ChunkIdMap(Mapping):
+    """Read-only FAISS position -> docstore id map over a (memory-mapped) int64 array."""
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return str(int(self.ids[position]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+class ChunkLabelMap(Mapping):
+    """FAISS label -> docstore id for indexes whose labels are the chunk ids."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, label: int) -> str:
+        return str(int(label))
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def __iter__(self):
+        from know.faissindex import index_labels
+        return iter(int(label) for label in index_labels(self.index))
@@ -0,0 +1,193 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (EMBED_CACHE, EMBED_CACHE_MAX_ENTRIES, EMBED_MODEL_NAME,
+                    EMBED_QUERY_CACHE_SIZE, EMBED_QUERY_CACHE_PERSIST)
+
+# Kept outside metadata.db on purpose: --rebuild-db backs up and recreates metadata.db,
+# and the whole point of the cache is to survive that.
+CACHE_PATH = Path("db/embedding_cache.db")
+SQL_BATCH = 500 # keys per IN (...) lookup, well under SQLite's variable limit
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an embedding model with a persistent content-hash → vector cache.
+    Only texts never embedded before with the same model reach the wrapped model.
+    Least recently used entries are evicted once max_entries is exceeded.
+    """
+    def __init__(self, embedding: Embeddings, model_name: str = EMBED_MODEL_NAME,
+                 path: Path = CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                hash TEXT,
+                model TEXT,
+                vector BLOB,
+                last_used REAL,
+                PRIMARY KEY (hash, model)
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(model, last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model = ?", (model_name,)).fetchone()[0]
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        now = time.time()
+        for i in range(0, len(keys), SQL_BATCH):
+            batch = keys[i:i + SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                (self.model_name, *batch)).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self._conn.execute(
+                f"UPDATE embeddings SET last_used = ? WHERE model = ? AND hash IN ({marks})",
+                (now, self.model_name, *batch))
+        return found
+
+    def _store(self, vectors: dict):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (hash, model, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(key, self.model_name, np.asarray(vec, dtype=np.float32).tobytes(), now)
+             for key, vec in vectors.items()])
+        self._size += len(vectors)
+        if self._size > self.max_entries:
+            self._evict(self._size - self.max_entries)
+
+    def _evict(self, n: int):
+        self._conn.execute('''
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings WHERE model = ? ORDER BY last_used LIMIT ?
+            )
+        ''', (self.model_name, n))
+        self._size = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+        print(f"[EmbedCache] Evicted {n} least recently used vectors.")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_hash(text) for text in texts]
+        with self._lock:
+            found = self._lookup(list(set(keys)))
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in found:
+                    missing.setdefault(key, text)
+            self.hits += len(texts) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+
+            if missing:
+                vectors = self.embedding.embed_documents(list(missing.values()))
+                new = dict(zip(missing.keys(), vectors))
+                self._store(new)
+                found.update(new)
+            self._conn.commit()
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedding.embed_query(text)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (f"[EmbedCache] {self.hits} hits / {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self._size} vectors cached for {self.model_name}")
+
+class QueryCache(Embeddings):
+    """
+    In-process LRU of question embeddings, so repeated questions (and Gradio retries)
+    skip the embedding model. With persist=True misses also go to a queries table in
+    the embedding cache DB, which survives restarts. Documents pass straight through.
+    """
+    def __init__(self, embedding: Embeddings, model_name: str = EMBED_MODEL_NAME,
+                 size: int = EMBED_QUERY_CACHE_SIZE, persist: bool = EMBED_QUERY_CACHE_PERSIST,
+                 path: Path = CACHE_PATH):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.size = size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if persist:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS queries (
+                    hash TEXT,
+                    model TEXT,
+                    vector BLOB,
+                    PRIMARY KEY (hash, model)
+                )
+            ''')
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = content_hash(text)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            vector = self._load(key)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self._save(key, vector)
+        with self._lock:
+            self._lru[key] = vector
+            if len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+        return vector
+
+    def _load(self, key: str):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT vector FROM queries WHERE hash = ? AND model = ?", (key, self.model_name)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def _save(self, key: str, vector: List[float]):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO queries (hash, model, vector) VALUES (?, ?, ?)",
+                               (key, self.model_name, np.asarray(vector, dtype=np.float32).tobytes()))
+            self._conn.commit()
+
+def with_query_cache(embedding: Embeddings) -> Embeddings:
+    """Wrap embedding in the question embedding LRU unless disabled or already wrapped."""
+    if EMBED_QUERY_CACHE_SIZE <= 0 or isinstance(embedding, QueryCache):
+        return embedding
+    return QueryCache(embedding)
+
+def with_embedding_cache(embedding: Embeddings) -> Embeddings:
+    """Wrap embedding in the persistent cache unless disabled or already wrapped."""
+    if not EMBED_CACHE or isinstance(embedding, CachedEmbeddings):
+        return embedding
+    return CachedEmbeddings(embedding)
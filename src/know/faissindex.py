@@ -0,0 +1,181 @@
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+from config import (FAISS_INDEX_TYPE, FAISS_MEMORY_MB, FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION,
+                    FAISS_HNSW_EF_SEARCH, FAISS_IVF_NLIST, FAISS_IVF_NPROBE, FAISS_PQ_M, FAISS_HNSW_REBUILD_DELETED)
+
+'''
+FAISS index selection for know.store.
+    flat      exact brute force, float32 in RAM (LangChain's default)
+    hnsw      graph index, lowest latency, float32 + graph links in RAM
+    ivf_flat  inverted lists, searches nprobe of nlist clusters, needs training
+    ivf_sq8   as ivf_flat with 8-bit scalar quantization (4x smaller)
+    ivf_pq    as ivf_flat with product quantization (~16-32x smaller), lossy
+The chosen type and parameters are saved as index_config.json next to index.faiss.
+IVF indexes are labelled with chunk ids (config "labels": "chunk_id"), so deletes remove
+vectors in place; flat and HNSW use positions 0..n-1 mapped to chunk ids by index_ids.npy.
+'''
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_sq8", "ivf_pq")
+CONFIG_FILE = "index_config.json"
+FLAT_MAX_CHUNKS = 20_000 # below this brute force is already fast and exact
+
+def needs_training(kind: str) -> bool:
+    return kind.startswith("ivf")
+
+def estimate_bytes(kind: str, n: int, dim: int) -> int:
+    if kind == "hnsw":
+        return n * (dim * 4 + FAISS_HNSW_M * 2 * 4)
+    if kind == "ivf_sq8":
+        return n * (dim + 8)
+    if kind == "ivf_pq":
+        return n * (_pq_m(dim) + 8)
+    return n * dim * 4 + (n * 8 if kind == "ivf_flat" else 0)
+
+def choose_index_type(n: int, dim: int, memory_mb: int = FAISS_MEMORY_MB) -> str:
+    """Pick the fastest index type whose estimated size fits the memory budget."""
+    if n < FLAT_MAX_CHUNKS:
+        return "flat"
+    budget = memory_mb * 1024 * 1024
+    for kind in ("hnsw", "ivf_flat", "ivf_sq8"):
+        if estimate_bytes(kind, n, dim) <= budget:
+            return kind
+    return "ivf_pq"
+
+def _pq_m(dim: int) -> int:
+    # Number of PQ sub-quantizers: must divide dim; aim for ~8 dims per sub-vector
+    if FAISS_PQ_M:
+        return FAISS_PQ_M
+    for m in (dim // 8, 64, 48, 32, 24, 16, 8, 4, 2):
+        if m and dim % m == 0:
+            return m
+    return 1
+
+def _nlist(n: int, n_train: int) -> int:
+    nlist = FAISS_IVF_NLIST or int(4 * math.sqrt(n))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, n_train // 39, 65536))
+
+def build_index(kind: str, dim: int, n_expected: int, train_vectors: np.ndarray = None):
+    """
+    Create an empty (trained, if needed) FAISS index of the given kind.
+    Returns (index, config) where config is what gets written to index_config.json.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{kind}'. Use one of: {', '.join(INDEX_TYPES)}, auto")
+    if kind == "ivf_pq" and len(train_vectors) < 256: # PQ needs >= 256 points per codebook
+        print("[FAISS] Too few vectors to train PQ, using ivf_sq8 instead.")
+        kind = "ivf_sq8"
+    params = {}
+    if kind == "flat":
+        factory = "Flat"
+    elif kind == "hnsw":
+        factory = f"HNSW{FAISS_HNSW_M}"
+        params["efConstruction"] = FAISS_HNSW_EF_CONSTRUCTION
+    else:
+        nlist = _nlist(n_expected, len(train_vectors))
+        codec = {"ivf_flat": "Flat", "ivf_sq8": "SQ8", "ivf_pq": f"PQ{_pq_m(dim)}"}[kind]
+        factory = f"IVF{nlist},{codec}"
+        params["nlist"] = nlist
+
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    if kind == "hnsw":
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    if needs_training(kind):
+        print(f"[FAISS] Training {factory} on {len(train_vectors)} vectors...")
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+
+    config = {"type": kind, "factory": factory, "dim": dim, "n_expected": n_expected, "params": params}
+    if needs_training(kind):
+        config["labels"] = "chunk_id"
+    apply_search_params(index, config)
+    print(f"[FAISS] Index type: {kind} ({factory}) for ~{n_expected} chunks")
+    return index, config
+
+def resolve_index_type(n: int, dim: int) -> str:
+    kind = FAISS_INDEX_TYPE.lower()
+    return choose_index_type(n, dim) if kind == "auto" else kind
+
+def apply_search_params(index, config: dict):
+    """Set query-time knobs (nprobe for IVF, efSearch for HNSW) from config."""
+    kind = config.get("type", "flat")
+    params = config.setdefault("params", {})
+    if needs_training(kind):
+        params["nprobe"] = FAISS_IVF_NPROBE
+        faiss.extract_index_ivf(index).nprobe = FAISS_IVF_NPROBE
+    elif kind == "hnsw":
+        params["efSearch"] = FAISS_HNSW_EF_SEARCH
+        faiss.downcast_index(index).hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+def save_index_config(config: dict, db_dir):
+    with open(os.path.join(db_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=4)
+
+def load_index_config(db_dir) -> dict:
+    path = os.path.join(db_dir, CONFIG_FILE)
+    if not os.path.exists(path):
+        return {"type": "flat", "factory": "Flat", "params": {}} # indexes built before index_config.json
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def uses_labels(config: dict) -> bool:
+    # FAISS labels are chunks.id values instead of positions
+    return config.get("labels") == "chunk_id"
+
+def index_labels(index) -> np.ndarray:
+    """Every label stored in a (labelled) IVF index, in inverted list order."""
+    invlists = faiss.extract_index_ivf(index).invlists
+    labels = []
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids = invlists.get_ids(list_no)
+            labels.append(faiss.rev_swig_ptr(ids, size).copy())
+            invlists.release_ids(list_no, ids)
+    return np.concatenate(labels) if labels else np.empty(0, dtype=np.int64)
+
+def supports_remove(index, config: dict) -> bool:
+    # Flat indexes renumber the remaining vectors 0..n-1 on remove_ids, which is what
+    # LangChain's FAISS.delete assumes; labelled IVF indexes remove by chunk id.
+    # Positional IVF keeps the old labels and HNSW can't remove at all.
+    return uses_labels(config) or isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+def defer_remove(config: dict, n_deleted: int, ntotal: int) -> bool:
+    """HNSW can only drop vectors by rebuilding the whole graph: leave deleted vectors in
+    (hidden by know.store.TombstoneFilter) until they are FAISS_HNSW_REBUILD_DELETED of it."""
+    return config.get("type") == "hnsw" and n_deleted < FAISS_HNSW_REBUILD_DELETED * ntotal
+
+def rebuild_without(index, config: dict, keep_positions, labels: np.ndarray = None, batch_size: int = 65536):
+    """Copy the kept vectors into a fresh index of the same type, for index types
+    that cannot remove vectors while keeping positions contiguous (HNSW, positional IVF).
+    Vectors are copied batch_size at a time, so only one batch is decoded in RAM.
+    IVF indexes keep their trained quantizer; SQ8/PQ vectors are re-encoded from
+    their decoded values. labels (chunk id per position) turns a positional IVF index
+    into a labelled one (see uses_labels); the caller updates config to match."""
+    keep = np.zeros(index.ntotal, dtype=bool)
+    keep[np.asarray(keep_positions, dtype=np.int64)] = True
+    if needs_training(config.get("type", "flat")):
+        faiss.extract_index_ivf(index).make_direct_map() # needed by reconstruct_n
+        fresh = faiss.clone_index(index)
+        fresh.reset()
+        faiss.extract_index_ivf(fresh).set_direct_map_type(faiss.DirectMap.NoMap)
+    else:
+        fresh = faiss.index_factory(index.d, config["factory"], faiss.METRIC_L2)
+        if config.get("type") == "hnsw":
+            fresh.hnsw.efConstruction = config["params"].get("efConstruction", FAISS_HNSW_EF_CONSTRUCTION)
+    for start in range(0, index.ntotal, batch_size):
+        mask = keep[start:start + batch_size]
+        if not mask.any():
+            continue
+        vectors = np.ascontiguousarray(index.reconstruct_n(start, len(mask))[mask], dtype=np.float32)
+        if labels is None:
+            fresh.add(vectors)
+        else:
+            fresh.add_with_ids(vectors, np.ascontiguousarray(labels[start:start + batch_size][mask], dtype=np.int64))
+    if needs_training(config.get("type", "flat")):
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.NoMap)
+    apply_search_params(fresh, config)
+    return fresh
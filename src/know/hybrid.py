@@ -0,0 +1,87 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from data import search_chunks
+from know.docstore import chunk_to_document
+
+# Shared by all queries: one thread runs the FAISS search while another runs BM25 in SQLite
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid")
+
+# Tokens too common to help BM25 but expensive to OR over millions of chunks
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "which", "who", "whom", "whose",
+    "when", "where", "why", "how", "does", "did", "with", "from", "into", "about", "that",
+    "this", "these", "those", "there", "their", "them", "they", "have", "has", "had",
+    "not", "but", "can", "could", "would", "should", "will", "its", "his", "her",
+}
+
+def keyword_query(question: str) -> str:
+    words = re.findall(r"[^\W_]+", question)
+    keywords = [w for w in words if len(w) > 2 and w.lower() not in STOPWORDS]
+    return " ".join(keywords or words)
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Document]], weights: List[float], rrf_k: int = 60) -> List[Document]:
+    """
+    Fuse ranked result lists: score(d) = sum(weight / (rrf_k + rank)).
+    Chunks are matched across lists by chunk_id (falling back to their text).
+    """
+    scores, docs = {}, {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked, start=1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Drop-in replacement for the FAISS retriever: runs BM25 over the SQLite
+    chunk store (FTS5) and FAISS vector search concurrently, then fuses the
+    two candidate lists with reciprocal rank fusion.
+    """
+    vector_retriever: BaseRetriever
+    k: int = 4                      # documents returned to the prompt
+    fetch_k: int = 20               # candidates taken from each retriever
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    rrf_k: int = 60
+    timeout: float = 5.0            # seconds to wait for either search before dropping it
+
+    def _vector_search(self, query: str) -> List[Document]:
+        search_kwargs = {**self.vector_retriever.search_kwargs, "k": self.fetch_k}
+        search_kwargs.setdefault("fetch_k", 2 * self.fetch_k) # headroom for the tombstone filter
+        return self.vector_retriever.vectorstore.similarity_search(query, **search_kwargs)
+
+    def _lexical_search(self, query: str) -> List[Document]:
+        rows = search_chunks(keyword_query(query), limit=self.fetch_k, match_all=False)
+        return [chunk_to_document(row) for row in rows]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        futures = {
+            "vector": _pool.submit(self._vector_search, query),
+            "lexical": _pool.submit(self._lexical_search, query),
+        }
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=self.timeout)
+            except TimeoutError:
+                print(f"[Warn] Hybrid retrieval: {name} search exceeded {self.timeout}s, skipped.")
+                results[name] = []
+            except Exception as e:
+                print(f"[Warn] Hybrid retrieval: {name} search failed: {e}")
+                results[name] = []
+
+        fused = reciprocal_rank_fusion(
+            [results["vector"], results["lexical"]],
+            [self.vector_weight, self.lexical_weight],
+            self.rrf_k,
+        )
+        return fused[:self.k]
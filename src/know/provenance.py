@@ -1,30 +1,20 @@
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 from langchain.schema import Document
 import os
+import time
 
-def run_rag_with_provenance(
-    question: str,
-    retriever,
-    model_path: str
-) -> Tuple[str, str]:
+from know.answercache import get_answer_cache
+from know.contextpack import pack_context
+
+def build_context_with_provenance(docs: List[Document]) -> Tuple[str, str]:
     """
-    Run RAG pipeline, retrieving documents with FAISS retriever then
-    constructing a prompt that includes provenance metadata.
+    Build the prompt context and the sources listing for retrieved chunks.
     Args:
-        question (str): The user question.
-        retriever: A LangChain retriever (e.g., FAISS-based).
-        model_path (str): Path to the LLM model.
+        docs (List[Document]): Retrieved chunks with metadata, or spans from pack_context.
     Returns:
-        sources (List[str]): List of source file paths for retrieved chunks.
-        answer (str): The LLM-generated answer.
+        context_text (str): Chunks tagged with their title and chunk index.
+        sources_text (str): Sorted source file lines with a short snippet.
     """
-    # Import here to avoid circular dependency
-    from llm import generate_answer
-
-    # Retrieve chunks as LangChain Document objects
-    docs: List[Document] = retriever.get_relevant_documents(question)
-
-    # Build context with metadata tags
     context_blocks: List[str] = []
     sources_info = set()
 
@@ -34,8 +24,12 @@ def run_rag_with_provenance(
         path = md.get("path", "unknown")
         page = md.get("page", "?")
         chunk_index = md.get("chunk_index", None)
+        chunk_indexes = md.get("chunk_indexes") or [chunk_index]
 
-        tag = f"[{title}" + (f"—chunk {chunk_index}" if chunk_index is not None else "") + "]"
+        if len(chunk_indexes) > 1:
+            tag = f"[{title}—chunks {chunk_indexes[0]}-{chunk_indexes[-1]}]"
+        else:
+            tag = f"[{title}" + (f"—chunk {chunk_index}" if chunk_index is not None else "") + "]"
         context_blocks.append(f"{tag} {doc.page_content}")
 
         filename = os.path.basename(path)
@@ -44,12 +38,90 @@ def run_rag_with_provenance(
         sources_info.add(f"{line}\n  ↳ {snippet}")
 
     context_text = "\n\n".join(context_blocks)
-    answer = generate_answer(question, context_text, model_path)
-
     sources_text = "\n\n".join(sorted(sources_info))
-    return sources_text, answer
+    return context_text, sources_text
+
+def _question_embeddings(retriever, cache):
+    # The retriever's own embedding model, used only for the similarity lookup
+    if not cache.similarity:
+        return None
+    vectorstore = getattr(getattr(retriever, "vector_retriever", retriever), "vectorstore", None)
+    return getattr(vectorstore, "embeddings", None)
+
+def run_rag_with_provenance(
+    question: str,
+    retriever,
+    model_path: str
+) -> Tuple[str, str]:
+    """
+    Run RAG pipeline, retrieving documents with FAISS retriever then
+    constructing a prompt that includes provenance metadata.
+    Args:
+        question (str): The user question.
+        retriever: A LangChain retriever (e.g., FAISS-based).
+        model_path (str): Path to the LLM model.
+    Returns:
+        sources (List[str]): List of source file paths for retrieved chunks.
+        answer (str): The LLM-generated answer.
+    """
+    sources_text, tokens = stream_rag_with_provenance(question, retriever, model_path)
+    return sources_text, "".join(tokens)
+
+def stream_rag_with_provenance(
+    question: str,
+    retriever,
+    model_path: str,
+    stats: dict = None,
+    history: List[Tuple[str, str]] = None
+) -> Tuple[str, Iterator[str]]:
+    """
+    Streaming variant of run_rag_with_provenance. Retrieval runs eagerly so
+    the sources are known up front; generation runs lazily as the caller
+    consumes the returned iterator. Answers are served from and saved to the
+    answer cache (know/answercache.py) when it is enabled.
+    Args:
+        question (str): The user question.
+        retriever: A LangChain retriever (e.g., FAISS-based).
+        model_path (str): Path to the LLM model.
+        stats (dict): Optional dict filled with TTFT and tokens/sec once generation ends.
+        history (List[Tuple[str, str]]): Earlier (question, answer) turns of a chat, oldest first.
+    Returns:
+        sources (str): Source listing for retrieved chunks.
+        tokens (Iterator[str]): The LLM answer, token by token.
+    """
+    # Import here to avoid circular dependency
+    from llm import context_token_budget, count_tokens, format_history, generation_signature, stream_answer
+
+    start = time.perf_counter()
+    docs: List[Document] = retriever.get_relevant_documents(question)
+    # Merge neighbouring chunks and keep the prompt within the token budget
+    history_text = format_history(history)
+    budget = context_token_budget(question, model_path, history_text)
+    docs = pack_context(docs, lambda text: count_tokens(text, model_path), budget)
+    context_text, sources_text = build_context_with_provenance(docs)
+
+    cache = get_answer_cache()
+    if cache is None:
+        return sources_text, stream_answer(question, context_text, model_path, stats, history_text)
+
+    chunk_ids = [chunk_id for doc in docs for chunk_id in doc.metadata["chunk_ids"]]
+    generation = generation_signature(model_path)
+    if history_text: # a follow-up question is only answered the same way after the same turns
+        generation["history"] = history_text
+    embeddings = _question_embeddings(retriever, cache)
+    vector = embeddings.embed_query(question) if embeddings else None
+
+    cached = cache.lookup(question, chunk_ids, generation, vector)
+    if cached:
+        print(f"[AnswerCache] {cached['match']} hit")
+        if stats is not None:
+            stats.update({"cached": cached["match"], "total": time.perf_counter() - start})
+        return cached["sources"], iter([cached["answer"]])
+
+    tokens = stream_answer(question, context_text, model_path, stats, history_text)
+    return sources_text, cache.record(tokens, question, chunk_ids, generation, sources_text, vector)
 """
 This module provides a RAG runner that includes metadata provenance
 for each retrieved chunk, injecting metadata into the prompt and
 returning both sources list and answer.
-"""
\ No newline at end of file
+"""
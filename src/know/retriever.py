@@ -1,136 +1,392 @@
 import hashlib
+import os
 import string
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from data import insert_document,insert_chunks, get_existing_hashes
-from config import EMBED_MODEL_NAME, GARBAGE_THRESHOLD
+from typing import Iterator, NamedTuple
+
+import numpy as np
+from data import (insert_document,insert_chunks, replace_rejected_chunks, get_existing_hashes, get_document_by_path, delete_document, transaction,
+                  get_document_hashes, get_manifest, upsert_manifest, get_pending_documents,
+                  get_documents_by_hash_algo, update_document_hash)
+from config import (EMBED_MODEL_NAME, GARBAGE_THRESHOLD, INGEST_WORKERS, INGEST_QUEUE_DEPTH, INGEST_COMMIT_EVERY,
+                    INGEST_HASH_THREADS)
 from langchain.schema import Document
 
-from ingest.chunker import detect_and_load_text
+from ingest.chunker import iter_pages
+
+HASH_ALGO = "blake2b" # documents indexed before the file manifest existed were hashed with md5
 
 #For large files, consider reading in chunks:
-def hash_file(file_path):
-    h = hashlib.md5()
+def hash_file(file_path, algorithm: str = HASH_ALGO):
+    h = hashlib.blake2b(digest_size=20) if algorithm == "blake2b" else hashlib.new(algorithm)
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+        for chunk in iter(lambda: f.read(1 << 20), b""):
             h.update(chunk)
-    return h.hexdigest() 
+    return h.hexdigest()
 
-def is_good_chunk(chunk: str) -> bool:
-    chunk = chunk.strip()
-    if len(chunk) < 10:
-        return False  # Too short
+# === Chunk quality ===
+# One table lookup per character gives all three counts in a single vectorized pass.
+# Flags for every BMP code point; index 0x10000 stands for all astral characters.
+_PRINTABLE, _ALNUM, _HIGH = 1, 2, 4
+_CHAR_FLAGS = None
 
-    # Too many high Unicode chars? => noisy
-    weird_unicode_ratio = sum(1 for c in chunk if ord(c) > 2000) / len(chunk)
-    if weird_unicode_ratio > 0.05:  # lower threshold for good chunks
-        return False
+def _char_flags() -> np.ndarray:
+    global _CHAR_FLAGS
+    if _CHAR_FLAGS is None:
+        flags = np.zeros(0x10001, dtype=np.uint8)
+        for cp in range(0x10000):
+            c = chr(cp)
+            flags[cp] = ((c in string.printable) * _PRINTABLE
+                         | c.isalnum() * _ALNUM
+                         | (cp > 2000) * _HIGH)
+        flags[0x10000] = _HIGH
+        _CHAR_FLAGS = flags
+    return _CHAR_FLAGS
 
-    # Check printable and alnum ratio more strictly
-    printable_ratio = sum(c in string.printable for c in chunk) / len(chunk)
-    alnum_ratio = sum(c.isalnum() for c in chunk) / len(chunk)
+class ChunkQuality(NamedTuple):
+    length: int             # characters after strip()
+    printable_ratio: float  # share of string.printable (ASCII) characters
+    alnum_ratio: float      # share of letters and digits, any script
+    unicode_ratio: float    # share of code points above 2000 (often OCR noise)
 
-    if printable_ratio < 0.9:  # pretty much all printable chars for good chunk
-        return False
-    if alnum_ratio < 0.5:  # at least half alnum
-        return False
+def score_chunk(chunk: str) -> ChunkQuality:
+    """Compute all quality ratios of a chunk in one pass. Stored in metadata.db with
+    the chunk, or in rejected_chunks if it was filtered out, so thresholds can be
+    re-applied without re-extracting."""
+    chunk = chunk.strip()
+    if not chunk:
+        return ChunkQuality(0, 0.0, 0.0, 0.0)
+    codes = np.frombuffer(chunk.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    flags = _char_flags()[np.minimum(codes, 0x10000)]
+    n = len(codes)
+    def share(bit):
+        return int(np.count_nonzero(flags & bit)) / n
+    return ChunkQuality(n, share(_PRINTABLE), share(_ALNUM), share(_HIGH))
 
-    # Passed all checks → chunk is "good"
-    return True
+def is_good_chunk(chunk: str, quality: ChunkQuality = None) -> bool:
+    q = quality or score_chunk(chunk)
+    if q.length < 10:
+        return False  # Too short
+    # Too many high Unicode chars? => noisy (lower threshold for good chunks)
+    if q.unicode_ratio > 0.05:
+        return False
+    # Pretty much all printable chars and at least half alnum for a good chunk
+    return q.printable_ratio >= 0.9 and q.alnum_ratio >= 0.5
 
 # Filtering bad chunks
-def is_trash(chunk):
-    chunk = chunk.strip()
-    if len(chunk) < 10:
+def is_trash(chunk: str, quality: ChunkQuality = None) -> bool:
+    q = quality or score_chunk(chunk)
+    if q.length < 10:
         return True
-
     # Remove overly aggressive Unicode exclusion
-    weird_unicode = sum(1 for c in chunk if ord(c) > 2000)
-    if weird_unicode / len(chunk) > 0.3:
+    if q.unicode_ratio > 0.3:
         return True
+    return q.printable_ratio < 0.6 or q.alnum_ratio < 0.2
 
-    printable_ratio = sum(c in string.printable for c in chunk) / len(chunk)
-    alnum_ratio = sum(c.isalnum() for c in chunk) / len(chunk)
+# === Change detection ===
+# Stage 0 (this process, I/O threads): stat every file, hash only new or changed ones.
+class ScannedFile(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    hash: str
+    hash_algo: str
+    unchanged: bool # same content as the document already indexed at this path
 
-    if printable_ratio < 0.6:
-        return True
-    if alnum_ratio < 0.2:
-        return True
-    return False
+def _hash_scanned(path: str, st, indexed_hash: str | None, manifest_row: tuple | None) -> ScannedFile:
+    signature = (path, st.st_size, st.st_mtime_ns, st.st_ino)
+    if indexed_hash is not None:
+        # Already indexed at this path: compare with the algorithm its stored hash was made with
+        algo = manifest_row[4] if manifest_row else "md5"
+        file_hash = hash_file(path, algo)
+        if file_hash == indexed_hash:
+            return ScannedFile(*signature, indexed_hash, algo, True)
+        if algo == HASH_ALGO:
+            return ScannedFile(*signature, file_hash, HASH_ALGO, False)
+    return ScannedFile(*signature, hash_file(path), HASH_ALGO, False)
 
-def chunk_documents(data_dir: str, split_func: callable) -> list[Document]:
-    """Load files from data_dir, extract and chunk text, filter trash,
-    and return list of Document objects with metadata."""
-    docs = []
-    existing_hashes = get_existing_hashes()
+def _rehash(path: str, legacy_hash: str, legacy_algo: str):
+    # One read for both digests; None if the file is gone or no longer has the indexed content
+    legacy = hashlib.new(legacy_algo)
+    current = hashlib.blake2b(digest_size=20)
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                legacy.update(chunk)
+                current.update(chunk)
+    except OSError:
+        return None
+    return (st, current.hexdigest()) if legacy.hexdigest() == legacy_hash else None
 
-    for path in Path(data_dir).rglob("*"):
-        if not path.is_file():
-            continue
+def rehash_legacy_documents():
+    """Re-hash documents indexed with md5 with HASH_ALGO (once), so duplicate
+    detection compares digests made with the same algorithm."""
+    legacy = get_documents_by_hash_algo(HASH_ALGO)
+    if not legacy:
+        return
+    rehashed = 0
+    with ThreadPoolExecutor(max_workers=max(1, INGEST_HASH_THREADS), thread_name_prefix="hash") as pool:
+        results = pool.map(lambda doc: _rehash(doc[1], doc[2], doc[3] or "md5"), legacy)
+        with transaction():
+            for (doc_id, path, _, _), result in zip(legacy, results):
+                if result is None: # missing or changed: the next scan replaces or keeps it as is
+                    continue
+                st, file_hash = result
+                update_document_hash(doc_id, file_hash)
+                upsert_manifest(path, st.st_size, st.st_mtime_ns, st.st_ino, file_hash, HASH_ALGO, "indexed")
+                rehashed += 1
+    print(f"[Scan] {rehashed}/{len(legacy)} documents re-hashed from md5 to {HASH_ALGO}")
 
-        file_hash = hash_file(path)
-        if file_hash in existing_hashes:
-            print(f"[SKIP] Already indexed: {path}(hash: {file_hash})")
-            continue
+def _is_current(row: tuple | None, st, key: str, indexed: dict) -> bool:
+    # Manifest row still describes the file on disk (and its document, if it was indexed)
+    return bool(row) and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino) \
+        and (row[5] != "indexed" or key in indexed)
+
+class IngestProgress:
+    """
+    Chunk count estimate for the embedding ETA, before the chunks exist.
+    count() stats (without reading) the files scan_data_dir will hash; while ingesting,
+    the chunks accepted so far are scaled by the share of those bytes already processed.
+    """
+    def __init__(self, files: int = 0, bytes_total: int = 0):
+        self.files = files
+        self.bytes_total = bytes_total
+        self.bytes_done = 0
+        self.chunks = 0
 
-        try:
-            docs_from_loader = detect_and_load_text(str(path))
-            print(f"[DEBUG] Running OCR artifact detection: {path.stem}")
-            if not docs_from_loader:
-                print(f"[SKIP] Unsupported file type: {path}")
+    @classmethod
+    def count(cls, data_dir: str) -> "IngestProgress":
+        manifest = get_manifest()
+        indexed = get_document_hashes()
+        progress = cls()
+        for path in Path(data_dir).rglob("*"):
+            if not path.is_file():
                 continue
-            text = "\n\n".join(doc.page_content for doc in docs_from_loader)
-        except Exception as e:
-            print(f"[ERROR] Cannot load file {path}: {e}")
-            continue
+            st = path.stat()
+            if not _is_current(manifest.get(str(path)), st, str(path), indexed):
+                progress.files += 1
+                progress.bytes_total += st.st_size
+        print(f"[Scan] {progress.files} new or changed files ({progress.bytes_total / 2**20:.1f} MiB)")
+        return progress
+
+    def file_done(self, size: int, chunks: int = 0):
+        self.bytes_done += size
+        self.chunks += chunks
+
+    def estimate_total(self) -> int | None:
+        if not self.bytes_done:
+            return None
+        if self.bytes_done >= self.bytes_total:
+            return self.chunks
+        return max(self.chunks, round(self.chunks * self.bytes_total / self.bytes_done))
 
-        chunks = split_func(text)
-        if not chunks:
-            print(f"[SKIP] No chunks extracted: {path}")
+def scan_data_dir(data_dir: str) -> Iterator[ScannedFile]:
+    """Yield the files of data_dir (in walk order) with their content hash. Files whose
+    size, mtime and inode match file_manifest are skipped without being read."""
+    manifest = get_manifest()
+    indexed = get_document_hashes()
+    threads = max(1, INGEST_HASH_THREADS)
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="hash") as pool:
+        pending = deque()
+        for path in Path(data_dir).rglob("*"):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            key = str(path)
+            row = manifest.get(key)
+            if _is_current(row, st, key, indexed):
+                skipped += 1
+                continue
+            pending.append(pool.submit(_hash_scanned, key, st, indexed.get(key), row))
+            if len(pending) >= 4 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    print(f"[Scan] {skipped} unchanged files skipped (size/mtime/inode match)")
+
+def record_scan(file: ScannedFile, status: str):
+    upsert_manifest(file.path, file.size, file.mtime_ns, file.inode, file.hash, file.hash_algo, status)
+
+def _files_to_prepare(files: Iterator[ScannedFile], existing_hashes: set,
+                      progress: IngestProgress = None) -> Iterator[ScannedFile]:
+    for file in files:
+        if file.unchanged: # touched or copied back, same bytes
+            record_scan(file, "indexed")
+        elif file.hash in existing_hashes:
+            print(f"[SKIP] Already indexed: {file.path}(hash: {file.hash})")
+            record_scan(file, "rejected")
+        else:
+            yield file
             continue
+        if progress:
+            progress.file_done(file.size)
+
+# === Parallel ingestion pipeline ===
+# Stage 1 (worker processes): load, clean, split and trash-filter one file.
+# Stage 2 (this process): the single SQLite writer, consuming results in file order.
+def prepare_file(file: ScannedFile, split_func: callable) -> dict:
+    """Run the CPU-heavy part of ingestion for one file. Returns the log lines
+    to print and, if the file is accepted, its filtered chunks.
+    status is "rejected" for files that should not be retried until they change."""
+    path = Path(file.path)
+    result = {"file": file, "path": file.path, "hash": file.hash, "log": [], "total": 0, "trash": 0,
+              "chunks": None, "rejected": [], "status": "rejected"}
+
+    try:
+        pages = iter_pages(str(path))
+        print(f"[DEBUG] Running OCR artifact detection: {path.stem}")
+        if pages is None:
+            result["log"].append(f"[SKIP] Unsupported file type: {path}")
+            return result
+        # Pages are loaded, cleaned and split one at a time; only the chunks are kept
+        chunks = list(split_func(pages))
+    except Exception as e:
+        result["log"].append(f"[ERROR] Cannot load file {path}: {e}")
+        result["status"] = "error"
+        return result
 
-        print(f"Indexed: {path} | Chunks: {len(chunks)}")
+    if not chunks:
+        result["log"].append(f"[SKIP] No chunks extracted: {path}")
+        return result
 
-        trash_count = sum(1 for chunk in chunks if is_trash(chunk))
-        if trash_count / len(chunks) > GARBAGE_THRESHOLD:
-            print(f"[SKIP] File mostly garbage: {path} ({trash_count}/{len(chunks)} chunks)")
+    result["total"] = len(chunks)
+    result["log"].append(f"Indexed: {path} | Chunks: {len(chunks)}")
+
+    # Score every chunk once; both the garbage check and the filter reuse the scores
+    scored = [(chunk, page, score_chunk(chunk)) for chunk, page in chunks]
+    trash = [is_trash(chunk, quality) for chunk, _, quality in scored]
+    trash_count = sum(trash)
+    result["trash"] = trash_count
+    garbage = trash_count / len(chunks) > GARBAGE_THRESHOLD
+    # Scores of the chunks that won't be stored, kept so thresholds can be tuned without re-extracting
+    result["rejected"] = [(position, {"quality": quality, "page": page})
+                          for position, ((_, page, quality), is_bad) in enumerate(zip(scored, trash))
+                          if is_bad or garbage]
+    if garbage:
+        result["log"].append(f"[SKIP] File mostly garbage: {path} ({trash_count}/{len(chunks)} chunks)")
+        return result
+
+    # Filter trash chunks and add OCR metadata
+    filtered_chunks = []
+    for (chunk, page, quality), is_bad in zip(scored, trash):
+        if is_bad:
             continue
+        skip_ocr_fix = is_good_chunk(chunk, quality)
+        filtered_chunks.append((' '.join(chunk.split()), {"skip_ocr_fix": skip_ocr_fix, "quality": quality, "page": page}))
+    result["chunks"] = filtered_chunks
+    result["status"] = "indexed"
+    return result
 
-        # Filter trash chunks and add OCR metadata
-        filtered_chunks = []
-        for chunk in chunks:
-            if is_trash(chunk):
-                continue
-            skip_ocr_fix = is_good_chunk(chunk)
-            filtered_chunks.append((chunk, {"skip_ocr_fix": skip_ocr_fix}))
-
-        doc_id = insert_document(
-            str(path), path.stem, file_hash, path.suffix[1:], EMBED_MODEL_NAME
-        )
-
-        accepted = 0
-        final_chunks = []
-        for idx, (chunk, metadata) in enumerate(filtered_chunks): 
-            page_num = "?" # update page data here if needed
-            chunk = ' '.join(chunk.split())
-            docs.append(Document(
-                page_content=chunk,
-                metadata={
-                    "doc_id": doc_id,
-                    "path": str(path),
-                    "title": path.stem,
-                    "chunk_index": idx,
-                    "page": page_num,
-                    "skip_ocr_fix": metadata.get("skip_ocr_fix", False),
-                }
-            ))
-            final_chunks.append((chunk, metadata))
-            accepted += 1
-
-        if final_chunks:
-            print(f"[DB] Inserting {len(final_chunks)} chunks to DB for {path.name}")
-            insert_chunks(doc_id, final_chunks)
-
-        print(f"Accepted {accepted}/{len(chunks)} chunks from {path.stem}")
-
-    return docs
\ No newline at end of file
+def iter_prepared_files(files: Iterator[ScannedFile], split_func: callable):
+    """Yield prepare_file results in the same order as files, using
+    INGEST_WORKERS processes with at most INGEST_QUEUE_DEPTH files in flight."""
+    workers = max(1, INGEST_WORKERS)
+    if workers == 1:
+        for file in files:
+            yield prepare_file(file, split_func)
+        return
+
+    depth = max(workers, INGEST_QUEUE_DEPTH)
+    print(f"[Info] Ingesting with {workers} workers (queue depth {depth})")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for file in files:
+            pending.append(pool.submit(prepare_file, file, split_func))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def discard_pending_documents():
+    # Documents of a run that stopped before its FAISS save have no vectors: drop them
+    # (their manifest rows go too), so this scan ingests the files again
+    pending = get_pending_documents()
+    for doc_id, _ in pending:
+        delete_document(doc_id)
+    if pending:
+        print(f"[Info] {len(pending)} documents of an interrupted ingest will be ingested again")
+
+def _write_result(result: dict, existing_hashes: set, progress: IngestProgress = None) -> list[Document]:
+    # Stage 2 for one prepared file: write its document and chunk rows, return its chunks to embed
+    for line in result["log"]:
+        print(line)
+    filtered_chunks = result["chunks"]
+    path, file_hash = Path(result["path"]), result["hash"]
+    if filtered_chunks is not None and file_hash in existing_hashes: # duplicate content seen earlier in this run
+        print(f"[SKIP] Already indexed: {path}(hash: {file_hash})")
+        filtered_chunks = None
+    if progress:
+        progress.file_done(result["file"].size, len(filtered_chunks or ()))
+    if filtered_chunks is None:
+        if result["status"] in ("rejected", "indexed"):
+            record_scan(result["file"], "rejected")
+        if result["status"] == "rejected":
+            replace_rejected_chunks(str(path), file_hash, result["rejected"])
+        return []
+
+    existing_doc = get_document_by_path(str(path))
+    if existing_doc: # same path, new content: replace the old chunks and vectors
+        old_chunk_ids = delete_document(existing_doc["id"])
+        print(f"[UPDATE] File changed: {path} ({len(old_chunk_ids)} old chunks tombstoned)")
+
+    doc_id = insert_document(
+        str(path), path.stem, file_hash, path.suffix[1:], EMBED_MODEL_NAME,
+        chunk_count=result["total"], trash_count=result["trash"]
+    )
+    existing_hashes.add(file_hash)
+    record_scan(result["file"], "pending") # "indexed" once the FAISS index is saved
+
+    if filtered_chunks:
+        print(f"[DB] Inserting {len(filtered_chunks)} chunks to DB for {path.name}")
+    chunk_ids = insert_chunks(doc_id, filtered_chunks)
+    replace_rejected_chunks(str(path), file_hash, result["rejected"])
+
+    documents = []
+    for idx, ((chunk, metadata), chunk_id) in enumerate(zip(filtered_chunks, chunk_ids)):
+        page_num = metadata.get("page") or "?" # "?" for loaders without pages
+        documents.append(Document(
+            page_content=chunk,
+            metadata={
+                "doc_id": doc_id,
+                "chunk_id": chunk_id, # stable FAISS id, see know.store
+                "path": str(path),
+                "title": path.stem,
+                "chunk_index": idx,
+                "page": page_num,
+                "skip_ocr_fix": metadata.get("skip_ocr_fix", False),
+            }
+        ))
+
+    print(f"Accepted {len(documents)}/{result['total']} chunks from {path.stem}")
+    return documents
+
+def iter_chunk_documents(data_dir: str, split_func: callable, progress: IngestProgress = None) -> Iterator[Document]:
+    """Load files from data_dir, extract and chunk text, filter trash,
+    and yield Document objects with metadata as each batch of files is written to the DB,
+    so embedding can start while later files are still loading.
+    split_func takes an iterable of page Documents and yields (chunk, page), see
+    ingest.chunker.split_pages. It must be picklable (e.g. a functools.partial) when INGEST_WORKERS > 1.
+    progress (from IngestProgress.count) is updated as each file is finished."""
+    discard_pending_documents()
+    rehash_legacy_documents()
+    existing_hashes = get_existing_hashes()
+
+    files = _files_to_prepare(scan_data_dir(data_dir), existing_hashes, progress)
+    results = iter_prepared_files(files, split_func)
+    while batch := list(islice(results, max(1, INGEST_COMMIT_EVERY))):
+        # One transaction per batch of files, committed before its chunks are yielded:
+        # the write lock on metadata.db is never held while chunks are being embedded
+        with transaction():
+            documents = [doc for result in batch for doc in _write_result(result, existing_hashes, progress)]
+        yield from documents
+
+def chunk_documents(data_dir: str, split_func: callable) -> list[Document]:
+    """List version of iter_chunk_documents."""
+    return list(iter_chunk_documents(data_dir, split_func))
@@ -1,23 +1,541 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import faiss
+import numpy as np
+from filelock import FileLock, Timeout
 from langchain_community.vectorstores import FAISS
 
+from config import (EMBED_BATCH_SIZE, EMBED_MODEL_NAME, FAISS_INDEX_TYPE, FAISS_TRAIN_SAMPLE, FAISS_EXPECTED_CHUNKS,
+                    HYBRID_SEARCH, HYBRID_K, HYBRID_FETCH_K, HYBRID_VECTOR_WEIGHT,
+                    HYBRID_LEXICAL_WEIGHT, HYBRID_RRF_K, HYBRID_TIMEOUT)
+from data import (bump_index_version, clear_tombstones, count_chunks, get_meta, get_tombstones, mark_pending_indexed,
+                  set_meta)
+from know.docstore import ChunkIdMap, ChunkLabelMap, SQLiteDocstore
+from know.embedcache import CachedEmbeddings, with_embedding_cache
+from know.faissindex import (CONFIG_FILE, apply_search_params, build_index, defer_remove, load_index_config,
+                             needs_training, rebuild_without, resolve_index_type, save_index_config,
+                             supports_remove, uses_labels)
+from know.hybrid import HybridRetriever
+
+IDS_FILE = "index_ids.npy"       # FAISS position -> chunks.id
+LEGACY_DOCSTORE = "index.pkl"    # pickled LangChain docstore of indexes built before SQLiteDocstore
+INDEX_FILES = (IDS_FILE, CONFIG_FILE, "index.faiss", LEGACY_DOCSTORE)
+CURRENT_FILE = "CURRENT"         # name of the index-<n> directory holding the live index
+VERSION_PREFIX = "index-"        # complete versions; saves in progress are .faiss_tmp_* directories
+TMP_PREFIX = ".faiss_tmp_"
+LOCK_FILE = ".index.lock"        # held by every process that changes the index on disk
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def index_lock(db_dir) -> FileLock:
+    """Exclusive lock on the index in db_dir, shared by saves, appends and compaction in
+    every process. One FileLock per directory, so it is re-entrant within a thread and
+    serializes threads of the same process (e.g. background compaction)."""
+    path = os.path.abspath(os.path.join(db_dir, LOCK_FILE))
+    with _locks_guard:
+        if path not in _locks:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _locks[path] = FileLock(path)
+        return _locks[path]
+
+
+def index_dir(db_dir) -> str:
+    """Directory of the live index: the version named in db_dir/CURRENT, or db_dir
+    itself for indexes saved before versioned directories."""
+    try:
+        with open(os.path.join(db_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return db_dir
+    return os.path.join(db_dir, name)
+
+
+def index_exists(db_dir) -> bool:
+    return os.path.exists(os.path.join(index_dir(db_dir), "index.faiss"))
+
+
+def _remove_old_versions(db_dir, current):
+    # Called with index_lock held, so no other save is in progress: every .faiss_tmp_*
+    # directory was left by a writer that died. Processes that still have an old
+    # version open keep reading it until they reload.
+    for name in os.listdir(db_dir):
+        path = os.path.join(db_dir, name)
+        if name.startswith((VERSION_PREFIX, TMP_PREFIX)) and name != current and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in INDEX_FILES: # pre-versioned layout, superseded
+            os.remove(path)
+
+
+def save_vector_store(vectorstore, db_dir):
+    """
+    Save a FAISS vector store without leaving a half-written index behind.
+    Every save is written to a temporary directory that is renamed to db_dir/index-<n>
+    once complete; the single atomic os.replace of db_dir/CURRENT then switches readers
+    from the old version to the new one. Runs under index_lock(db_dir).
+    Args:
+        vectorstore (FAISS): The vector store to persist.
+        db_dir (str): Directory path where FAISS index will be saved.
+    """
+    with index_lock(db_dir):
+        _save_locked(vectorstore, db_dir)
+
+
+def _save_locked(vectorstore, db_dir):
+    config = getattr(vectorstore, "index_config", None) or load_index_config(index_dir(db_dir))
+    if uses_labels(config): # the chunk ids are stored in index.faiss itself
+        docstore_ids = None
+    else:
+        docstore_ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    legacy = docstore_ids is not None and not all(docstore_id.isdigit() for docstore_id in docstore_ids)
+    if legacy:
+        print("[Warn] FAISS index predates stable chunk ids; saving in legacy pickle format.")
+
+    tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=db_dir)
+    name = f"{VERSION_PREFIX}{time.time_ns()}"
+    version_dir = os.path.join(db_dir, name)
+    try:
+        if legacy:
+            vectorstore.save_local(tmp_dir)
+        else:
+            # Only vectors and ids: chunk text and metadata stay in metadata.db (SQLiteDocstore)
+            if docstore_ids is not None:
+                np.save(os.path.join(tmp_dir, IDS_FILE),
+                        np.array([int(i) for i in docstore_ids], dtype=np.int64))
+            faiss.write_index(vectorstore.index, os.path.join(tmp_dir, "index.faiss"))
+        save_index_config(config, tmp_dir)
+        os.rename(tmp_dir, version_dir) # complete: only now can it become CURRENT
+
+        pointer = os.path.join(db_dir, f".{CURRENT_FILE}.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(db_dir, CURRENT_FILE))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    _remove_old_versions(db_dir, name)
+
+
+def _chunk_ids(chunks):
+    # FAISS docstore ids are the SQLite chunks.id values, so deletes can find their vectors.
+    return [str(chunk.metadata["chunk_id"]) for chunk in chunks]
+
+
+class TombstoneFilter:
+    """
+    FAISS metadata filter hiding chunks that were deleted from SQLite but whose
+    vectors are still in the loaded index. Tombstones are re-read every
+    refresh_seconds and never forgotten for the life of the process, because the
+    in-memory index keeps those vectors even after compaction clears the table.
+    """
+    def __init__(self, refresh_seconds: float = 30.0):
+        self.refresh_seconds = refresh_seconds
+        self.chunk_ids = set()
+        self._checked_at = 0.0
+
+    def __call__(self, metadata: dict) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at > self.refresh_seconds:
+            self.chunk_ids |= get_tombstones()
+            self._checked_at = now
+        return not metadata.get("deleted") and metadata.get("chunk_id") not in self.chunk_ids
+
+
+def _as_retriever(vectorstore):
+    vector_retriever = vectorstore.as_retriever(search_kwargs={"filter": TombstoneFilter()})
+    if not HYBRID_SEARCH:
+        return vector_retriever
+    return HybridRetriever(
+        vector_retriever=vector_retriever,
+        k=HYBRID_K,
+        fetch_k=HYBRID_FETCH_K,
+        vector_weight=HYBRID_VECTOR_WEIGHT,
+        lexical_weight=HYBRID_LEXICAL_WEIGHT,
+        rrf_k=HYBRID_RRF_K,
+        timeout=HYBRID_TIMEOUT,
+    )
+
+
+def _remove_vectors(vectorstore, ids) -> int:
+    """Remove the vectors of the given chunk ids. Returns how many were removed."""
+    config = vectorstore.index_config
+    if uses_labels(config): # in place; ids that aren't in the index are ignored
+        return vectorstore.index.remove_ids(np.array([int(i) for i in ids], dtype=np.int64))
+    if supports_remove(vectorstore.index, config):
+        vectorstore.delete(ids)
+        return len(ids)
+    # Positional HNSW and IVF can't remove while keeping positions 0..n-1: rebuild from the vectors we keep
+    drop = set(ids)
+    mapping = vectorstore.index_to_docstore_id
+    keep = [pos for pos in range(vectorstore.index.ntotal) if mapping[pos] not in drop]
+    if needs_training(config.get("type", "flat")):
+        # Saved before IVF indexes were labelled: relabel with chunk ids while copying, so later deletes are in place
+        labels = np.array([int(mapping[pos]) for pos in range(vectorstore.index.ntotal)], dtype=np.int64)
+        vectorstore.index = rebuild_without(vectorstore.index, config, keep, labels=labels)
+        config["labels"] = "chunk_id"
+        vectorstore.index_to_docstore_id = ChunkLabelMap(vectorstore.index)
+    else:
+        vectorstore.index = rebuild_without(vectorstore.index, config, keep)
+        vectorstore.index_to_docstore_id = {new: mapping[old] for new, old in enumerate(keep)}
+    return len(ids)
+
+
+def _apply_tombstones(vectorstore) -> tuple[set, int]:
+    """Remove tombstoned chunk vectors from a writable vector store.
+    Returns the tombstone ids that were handled (to clear) and how many vectors were removed."""
+    tombstones = get_tombstones()
+    if not tombstones:
+        return tombstones, 0
+    if uses_labels(vectorstore.index_config):
+        removed = _remove_vectors(vectorstore, tombstones)
+        if removed:
+            print(f"[Info] Removed {removed} deleted chunk vectors from FAISS.")
+        return tombstones, removed
+    indexed = set(vectorstore.index_to_docstore_id.values())
+    if any(not docstore_id.isdigit() for docstore_id in indexed):
+        print("[Warn] FAISS index predates stable chunk ids; run --rebuild-db once to enable deletes.")
+    ids = [str(chunk_id) for chunk_id in tombstones if str(chunk_id) in indexed]
+    if ids and defer_remove(vectorstore.index_config, len(ids), vectorstore.index.ntotal):
+        print(f"[FAISS] {len(ids)} deleted chunks stay hidden in the HNSW graph until a rebuild is worth it.")
+        return tombstones - {int(i) for i in ids}, 0 # tombstones without a vector can go
+    if ids:
+        _remove_vectors(vectorstore, ids)
+        print(f"[Info] Removed {len(ids)} deleted chunk vectors from FAISS.")
+    return tombstones, len(ids)
+
+
+def _report_cache(embedding):
+    if isinstance(embedding, CachedEmbeddings):
+        print(embedding.stats())
+
+
+def record_embedding_metadata(dim: int, model_name: str = EMBED_MODEL_NAME):
+    # Read back at startup instead of embedding a probe text to learn the dimension
+    set_meta("embedding_model", model_name)
+    set_meta("embedding_dim", dim)
+
+
+def check_index_consistency(vectorstore) -> bool:
+    # Every chunk row has exactly one vector; tombstoned vectors are the only allowed surplus.
+    ntotal, n_chunks = vectorstore.index.ntotal, count_chunks()
+    pending = len(get_tombstones())
+    if ntotal != n_chunks + pending:
+        print(f"[Warn] FAISS holds {ntotal} vectors but metadata.db has {n_chunks} chunks "
+              f"(+{pending} pending deletes). Consider --rebuild-db.")
+        return False
+    return True
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{secs:02d}s"
+
+
+def _new_vectorstore(vectors, embedding, n_expected):
+    # Size (and train, for IVF types) a new index on the vectors embedded so far
+    vectors = np.asarray(vectors, dtype=np.float32)
+    kind = resolve_index_type(n_expected, vectors.shape[1])
+    index, config = build_index(kind, vectors.shape[1], n_expected, vectors)
+    return _empty_vectorstore(embedding, index, config)
+
+
+def _empty_vectorstore(embedding, index, config):
+    index_to_docstore_id = ChunkLabelMap(index) if uses_labels(config) else {}
+    vectorstore = FAISS(embedding_function=embedding, index=index,
+                        docstore=SQLiteDocstore(), index_to_docstore_id=index_to_docstore_id)
+    vectorstore.index_config = config
+    return vectorstore
 
-def create_vector_store(db_dir, chunks, embedding):
+
+def _add_vectors(vectorstore, vectors, ids):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if uses_labels(vectorstore.index_config):
+        vectorstore.index.add_with_ids(vectors, np.array([int(i) for i in ids], dtype=np.int64))
+    else:
+        # Text and metadata are not needed: SQLiteDocstore reads them from metadata.db
+        vectorstore.add_embeddings(zip([""] * len(ids), vectors), ids=list(ids))
+
+
+class _VectorSpill:
+    """
+    Vectors of a new index kept in a temporary file until the last chunk is embedded,
+    so FAISS_INDEX_TYPE=auto and IVF nlist are sized for the real chunk count.
+    Only vectors and chunk ids are kept: text and metadata already live in metadata.db.
+    """
+    def __init__(self, spill_dir=None):
+        self._file = tempfile.TemporaryFile(prefix=".faiss_spill_", dir=spill_dir)
+        self.ids = []
+        self.dim = None
+
+    def add(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dim = vectors.shape[1]
+        self._file.write(vectors.tobytes())
+        self.ids.extend(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vectors(self) -> np.ndarray:
+        self._file.flush()
+        return np.memmap(self._file, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+
+    def close(self):
+        self._file.close()
+
+
+def _vectorstore_from_spill(spill, embedding, add_batch=65536):
+    n = len(spill)
+    vectors = spill.vectors()
+    n_expected = max(n, FAISS_EXPECTED_CHUNKS)
+    # Train on a sample spread over the whole corpus, not just the first files
+    if n > FAISS_TRAIN_SAMPLE:
+        sample = vectors[np.sort(np.random.default_rng(0).choice(n, FAISS_TRAIN_SAMPLE, replace=False))]
+    else:
+        sample = np.asarray(vectors)
+    kind = resolve_index_type(n_expected, spill.dim)
+    index, config = build_index(kind, spill.dim, n_expected, sample)
+    vectorstore = _empty_vectorstore(embedding, index, config)
+    for start in range(0, n, add_batch):
+        _add_vectors(vectorstore, vectors[start:start + add_batch], spill.ids[start:start + add_batch])
+    del vectors
+    return vectorstore
+
+
+def embed_in_batches(chunks, embedding, vectorstore=None, batch_size=EMBED_BATCH_SIZE, total=None, spill_dir=None):
+    """
+    Embed chunks from any iterable (list or generator) in batches of batch_size and
+    add each batch to the FAISS index as soon as it is embedded, reporting throughput.
+    With a generator from know.retriever, loading and embedding overlap.
+    A new auto or IVF index is only built once every chunk is embedded (the vectors wait
+    in a temporary file in spill_dir), so its type and nlist fit the real corpus size.
+    Args:
+        chunks (iterable): LangChain Document chunks carrying a chunk_id.
+        embedding (Embedding model): Embedding function/model to vectorize documents.
+        vectorstore (FAISS): Store to add to; a new one is created if None.
+        batch_size (int): Chunks embedded per step.
+        total (int or callable): Expected number of chunks for the ETA, or a function returning the
+            current estimate (e.g. IngestProgress.estimate_total); taken from len(chunks) if possible.
+        spill_dir (str): Directory for the temporary vector file (default: the system temp dir).
+    Returns:
+        (vectorstore, count): The store (None if nothing was embedded) and chunks added.
+    """
+    if total is None and hasattr(chunks, "__len__"):
+        total = len(chunks)
+    kind = FAISS_INDEX_TYPE.lower()
+    spill = None
+    if vectorstore is None and (kind == "auto" or needs_training(kind)):
+        spill = _VectorSpill(spill_dir)
+    start = time.perf_counter()
+    done = 0
+    try:
+        for batch in _batched(chunks, batch_size):
+            texts = [chunk.page_content for chunk in batch]
+            vectors = embedding.embed_documents(texts)
+            expected = total() if callable(total) else total
+            if spill is not None:
+                spill.add(vectors, _chunk_ids(batch))
+            else:
+                if vectorstore is None: # flat/hnsw: nothing to train, size is informational only
+                    vectorstore = _new_vectorstore(vectors, embedding, max(expected or 0, FAISS_EXPECTED_CHUNKS, len(batch)))
+                _add_vectors(vectorstore, vectors, _chunk_ids(batch))
+
+            done += len(batch)
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = max(0, expected - done) / rate if expected and rate else None
+            print(f"[Embed] {done}/{'~' if callable(total) and expected else ''}{expected or '?'} chunks"
+                  f" | {rate:.1f} chunks/s | ETA {_format_eta(eta)}")
+
+        if spill is not None and len(spill):
+            print(f"[FAISS] Building index for {len(spill)} chunks...")
+            vectorstore = _vectorstore_from_spill(spill, embedding)
+    finally:
+        if spill is not None:
+            spill.close()
+    return vectorstore, done
+
+
+def create_vector_store(db_dir, chunks, embedding, total=None):
     """
     Create a FAISS vector store from document chunks and save it locally.
     Args:
         db_dir (str): Directory path where FAISS index will be saved.
-        chunks (list): List of LangChain Document chunks.
+        chunks (iterable): LangChain Document chunks (list or generator).
         embedding (Embedding model): Embedding function/model to vectorize documents.
+        total (int or callable): Expected chunk count for the ETA, see embed_in_batches.
     Returns:
         retriever: A retriever object that enables querying the vector store.
     """
-    if not chunks:      
-        raise ValueError("No document chunks provided for vector store creation.")
-                
     print("Creating vector store with FAISS...")
-    vectorstore = FAISS.from_documents(documents=chunks, embedding=embedding)
-    vectorstore.save_local(db_dir)
-    return vectorstore.as_retriever()
+    embedding = with_embedding_cache(embedding) # only new or changed chunks get embedded
+    os.makedirs(db_dir, exist_ok=True)
+    vectorstore, count = embed_in_batches(chunks, embedding, total=total, spill_dir=db_dir)
+    if not count:
+        raise ValueError("No chunks found. Check your data directory or chunking logic.")
+    print(f"[Info] {count} good chunks indexed.")
+    _report_cache(embedding)
+    with index_lock(db_dir):
+        save_vector_store(vectorstore, db_dir)
+        mark_pending_indexed() # documents stay "pending" until their vectors are on disk
+        record_embedding_metadata(vectorstore.index.d)
+        clear_tombstones(get_tombstones()) # a fresh index holds no deleted vectors
+    bump_index_version() # invalidates cached answers
+    check_index_consistency(vectorstore)
+    return _as_retriever(vectorstore)
+
+
+def append_to_vector_store(db_dir, chunks, embedding, total=None):
+    """
+    Embed only the given (new) chunks and add them to the existing FAISS index.
+    Vectors of deleted or replaced chunks are removed in the same save.
+    Args:
+        db_dir (str): Directory path where FAISS index is stored.
+        chunks (iterable): LangChain Document chunks not yet in the index (list or generator).
+        embedding (Embedding model): Embedding function/model used during index creation.
+        total (int or callable): Expected chunk count for the ETA, see embed_in_batches.
+    Returns:
+        retriever: A retriever object for querying the updated vector store.
+    """
+    embedding = with_embedding_cache(embedding)
+    # Held from load to save: a compaction saving in between would be overwritten
+    with index_lock(db_dir):
+        vectorstore = _load_faiss(db_dir, embedding)
+
+        before = vectorstore.index.ntotal
+        print(f"Appending new chunks to FAISS vector store ({before} vectors)...")
+        vectorstore, count = embed_in_batches(chunks, embedding, vectorstore, total=total)
+        # Only now: ingesting an edited file tombstones its old chunks while chunks are consumed
+        tombstones, removed = _apply_tombstones(vectorstore)
+        if not count and not removed:
+            print("[Info] No new chunks to add. FAISS index unchanged.")
+            mark_pending_indexed() # documents without accepted chunks
+            clear_tombstones(tombstones)
+            return _as_retriever(vectorstore)
+
+        if count:
+            _report_cache(embedding)
+        save_vector_store(vectorstore, db_dir)
+        mark_pending_indexed()
+        clear_tombstones(tombstones)
+        if count:
+            bump_index_version()
+        print(f"[Info] Added {count} chunks. FAISS index now holds {vectorstore.index.ntotal} vectors.")
+        check_index_consistency(vectorstore)
+        return _as_retriever(vectorstore)
+
+
+def compact_vector_store(db_dir, embedding):
+    """
+    Remove vectors of deleted chunks from the FAISS index on disk.
+    Works on its own copy of the index, so it can run next to a live retriever
+    (which keeps hiding the same chunks through TombstoneFilter).
+    HNSW graphs are only rebuilt once FAISS_HNSW_REBUILD_DELETED of them is deleted.
+    Args:
+        db_dir (str): Directory path where FAISS index is stored.
+        embedding (Embedding model): Embedding function/model used during index creation.
+    """
+    tombstones = get_tombstones()
+    if not tombstones:
+        return
+    # Decided before loading a writable copy of the whole index
+    if defer_remove(load_index_config(index_dir(db_dir)), len(tombstones), count_chunks() + len(tombstones)):
+        return
+    lock = index_lock(db_dir)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout: # an append or another compaction is writing; tombstones stay for the next run
+        print("[Compaction] Index is being updated by another process; skipped.")
+        return
+    try:
+        print("[Compaction] Removing deleted chunks from FAISS index...")
+        vectorstore = _load_faiss(db_dir, embedding)
+        tombstones, removed = _apply_tombstones(vectorstore)
+        if removed:
+            save_vector_store(vectorstore, db_dir)
+        clear_tombstones(tombstones)
+        check_index_consistency(vectorstore)
+    finally:
+        lock.release()
+    print("[Compaction] Done.")
+
+
+def start_background_compaction(db_dir, embedding) -> threading.Thread | None:
+    if not get_tombstones():
+        return None
+    thread = threading.Thread(target=compact_vector_store, args=(db_dir, embedding), daemon=True)
+    thread.start()
+    return thread
+
+
+def _read_index(path, mmap):
+    """Returns (index, mapped). Falls back to reading into RAM for index types that cannot be mapped."""
+    if mmap:
+        # Map the file instead of reading it: pages load on demand and are shared between processes.
+        # MMAP_IFC (faiss >= 1.11) maps flat/HNSW storage; MMAP maps IVF inverted lists.
+        flags = [getattr(faiss, "IO_FLAG_MMAP_IFC", 0), faiss.IO_FLAG_MMAP]
+        for flag in filter(None, flags):
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError:
+                continue
+        print("[FAISS] Memory-mapping not supported for this index; reading into RAM.")
+    return faiss.read_index(path), False
+
+
+def _load_faiss(db_dir, embedding, mmap=False):
+    """
+    Load index.faiss with a SQLiteDocstore. mmap=True opens a read-only memory-mapped
+    index for querying; writers (append, compaction) load a writable copy.
+    """
+    db_dir = index_dir(db_dir)
+    config = load_index_config(db_dir)
+    ids_path = os.path.join(db_dir, IDS_FILE)
+    if uses_labels(config):
+        index, mmap = _read_index(os.path.join(db_dir, "index.faiss"), mmap)
+        vectorstore = FAISS(embedding_function=embedding, index=index, docstore=SQLiteDocstore(),
+                            index_to_docstore_id=ChunkLabelMap(index))
+    elif os.path.exists(ids_path):
+        index, mmap = _read_index(os.path.join(db_dir, "index.faiss"), mmap)
+        ids = np.load(ids_path, mmap_mode="r" if mmap else None)
+        index_to_docstore_id = ChunkIdMap(ids) if mmap else {i: str(int(c)) for i, c in enumerate(ids)}
+        vectorstore = FAISS(embedding_function=embedding, index=index, docstore=SQLiteDocstore(),
+                            index_to_docstore_id=index_to_docstore_id)
+    else:
+        print("[Warn] Loading legacy pickled FAISS docstore. Run --rebuild-db to switch to metadata.db lookups.")
+        mmap = False
+        vectorstore = FAISS.load_local(
+            db_dir,
+            embeddings=embedding,
+            allow_dangerous_deserialization=True  # Needed due to known safety issues in deserialization
+        )
+    # Restore the index type chosen at build time and apply current nprobe/efSearch
+    vectorstore.index_config = config
+    apply_search_params(vectorstore.index, vectorstore.index_config)
+    print(f"[FAISS] Loaded {vectorstore.index_config['type']} index with {vectorstore.index.ntotal} vectors"
+          + (" (memory-mapped)" if mmap else ""))
+    return vectorstore
 
 
 def load_vector_store(db_dir, embedding):
@@ -30,8 +548,12 @@ def load_vector_store(db_dir, embedding):
         retriever: A retriever object for querying the loaded vector store.
     """
     print("Loading existing FAISS vector store...")
-    return FAISS.load_local(
-        db_dir,
-        embeddings=embedding,
-        allow_dangerous_deserialization=True  # Needed due to known safety issues in deserialization
-    ).as_retriever()
+    vectorstore = _load_faiss(db_dir, embedding, mmap=True)
+    stored_dim = get_meta("embedding_dim")
+    if stored_dim is None:
+        record_embedding_metadata(vectorstore.index.d) # index built before embedding metadata was stored
+    elif int(stored_dim) != vectorstore.index.d:
+        print(f"[Warn] FAISS index has {vectorstore.index.d} dims but metadata.db records {stored_dim}. "
+              "Run --rebuild-db if results look wrong.")
+    start_background_compaction(db_dir, embedding)
+    return _as_retriever(vectorstore)
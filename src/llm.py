@@ -1,32 +1,185 @@
 import argparse
 import llama_cpp
 import os
+import threading
+import time
+from typing import Iterator
 
 from langchain_community.llms import LlamaCpp
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from config import DATA_DIR, DB_DIR, MODEL_PATH, LLAMA_CPP_PARAMS
-from know.provenance import run_rag_with_provenance
+from config import (DATA_DIR, DB_DIR, MODEL_PATH, LLAMA_CPP_PARAMS, CONTEXT_TOKEN_BUDGET, CONTEXT_ANSWER_TOKENS,
+                    PROMPT_CACHE_MB)
+from know.provenance import run_rag_with_provenance, stream_rag_with_provenance
 
 print("llama-cpp-python version:", llama_cpp.__version__)
 
+# The instructions come first and never change, so their KV state is evaluated once and reused
+# (see ModelManager.seed_prompt_cache); {history} turns, then the question, follow.
+SYSTEM_PROMPT = (
+    "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n"
+    "You are an insightful research assistant. Use the context below to construct a thoughtful, multi-layered answer. "
+    "Do not speculate. If unsure, admit it honestly. Use [doc#] to cite sources.<|eot_id|>"
+)
+PROMPT = ChatPromptTemplate.from_template(
+    SYSTEM_PROMPT +
+    "{history}"
+    "<|start_header_id|>user<|end_header_id|>\n"
+    "Question: {question} \n"
+    "Context: {context} <|eot_id|>"
+    "<|start_header_id|>assistant<|end_header_id|>\n"
+)
+HISTORY_TURN = (
+    "<|start_header_id|>user<|end_header_id|>\n"
+    "Question: {question} <|eot_id|>"
+    "<|start_header_id|>assistant<|end_header_id|>\n"
+    "{answer}<|eot_id|>"
+)
+
+def format_history(turns) -> str:
+    # Earlier (question, answer) pairs of a chat, without their retrieved context
+    return "".join(HISTORY_TURN.format(question=q, answer=a) for q, a in turns or [])
+
+def prompt_prefix() -> str:
+    # The rendered prompt up to the end of the system block, exactly as llama.cpp will see it
+    text = PROMPT.format_prompt(history="", question="", context="").to_string()
+    return text[:text.index(SYSTEM_PROMPT) + len(SYSTEM_PROMPT)]
+
+# === Resident Model Manager ===
+class ModelManager:
+    """
+    Keep a single LlamaCpp instance loaded for the lifetime of the process.
+    The model is (re)built only when the model path or the llama.cpp params change,
+    so repeated questions from the CLI loop or the Web UI reuse the loaded weights.
+    """
+    def __init__(self, params: dict):
+        self.params = dict(params)
+        self._llm = None
+        self._loaded_params = None
+        self._lock = threading.Lock()
+        # llama.cpp contexts are not reentrant: one generation at a time per loaded model
+        self.generation_lock = threading.Lock()
+
+    def _resolve_params(self, model_path: str = None) -> dict:
+        params = dict(self.params)
+        if model_path:
+            params["model_path"] = model_path
+        return params
+
+    def get(self, model_path: str = None) -> LlamaCpp:
+        params = self._resolve_params(model_path)
+        with self._lock:
+            if self._llm is None or params != self._loaded_params:
+                if self._llm is not None:
+                    print(f"[Info] Model params changed, reloading: {params['model_path']}")
+                    self.unload()
+                print(f"[Info] Loading LLM: {params['model_path']}")
+                self._llm = LlamaCpp(**params)
+                self._loaded_params = params
+                if PROMPT_CACHE_MB > 0:
+                    # Saved KV states, restored for any prompt starting with the same tokens
+                    self._llm.client.set_cache(llama_cpp.LlamaRAMCache(capacity_bytes=PROMPT_CACHE_MB << 20))
+            return self._llm
+
+    def unload(self):
+        # Drop the reference so llama.cpp can free the weights and KV cache.
+        self._llm = None
+        self._loaded_params = None
+
+    def warm_up(self, model_path: str = None):
+        # Load the weights and evaluate one token so the first user query doesn't pay for it.
+        llm = self.get(model_path)
+        print("[Info] Warming up LLM...")
+        llm.invoke("Hello", max_tokens=1)
+        self.seed_prompt_cache(llm)
+        print("[Info] LLM ready.")
+
+    def seed_prompt_cache(self, llm: LlamaCpp):
+        """Evaluate the fixed system prefix once and keep its KV state, so queries only
+        evaluate their history, question and context."""
+        client = llm.client
+        if client.cache is None:
+            return
+        start = time.perf_counter()
+        tokens = client.tokenize(prompt_prefix().encode("utf-8"), special=True)
+        with self.generation_lock:
+            client.reset()
+            client.eval(tokens)
+            client.cache[tokens] = client.save_state()
+        print(f"[Info] Prompt prefix cached: {len(tokens)} tokens in {time.perf_counter() - start:.2f}s")
+
+model_manager = ModelManager(LLAMA_CPP_PARAMS)
+
 # === LLM Generation ===
-def generate_answer(question, context, model_path):
-    # Generate a response from the LLM given the question and retrieved context.
-    prompt = ChatPromptTemplate.from_template(
-        "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n"
-        "You are an insightful research assistant. Use the context below to construct a thoughtful, multi-layered answer. "
-        "Do not speculate. If unsure, admit it honestly. Use [doc#] to cite sources.\n"
-        "Question: {question} \n"
-        "Context: {context} \n"
-        "<|start_header_id|>assistant<|end_header_id|>\n"
-    )
-    # Load LLaMA.cpp compatibal  model with GPU acceleration settings
-    llm = LlamaCpp(**LLAMA_CPP_PARAMS)
-   # Compose the prompt + llm + output parser chain
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"context": context, "question": question})
+# llama.cpp params that change the generated text (the answer cache keys on them)
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k", "repeat_penalty", "max_tokens", "n_ctx")
+
+def generation_signature(model_path: str = None) -> dict:
+    params = model_manager._resolve_params(model_path)
+    return {
+        "model_path": params.get("model_path"),
+        "prompt": PROMPT.pretty_repr(),
+        **{name: params.get(name) for name in SAMPLING_PARAMS},
+    }
+
+def count_tokens(text: str, model_path: str = None) -> int:
+    # The loaded model's own tokenizer, so budgets match what llama.cpp evaluates
+    return model_manager.get(model_path).get_num_tokens(text)
+
+def context_token_budget(question: str, model_path: str = None, history: str = "") -> int | None:
+    """Tokens available for retrieved context: CONTEXT_TOKEN_BUDGET, capped so the
+    prompt around it (including chat history) plus CONTEXT_ANSWER_TOKENS still fit in n_ctx.
+    None means no limit; 0 means the window is already full and no context fits."""
+    budget = CONTEXT_TOKEN_BUDGET or None
+    n_ctx = model_manager._resolve_params(model_path).get("n_ctx")
+    if not n_ctx:
+        return budget
+    prompt = PROMPT.format_prompt(history=history, question=question, context="").to_string()
+    available = max(0, n_ctx - count_tokens(prompt, model_path) - CONTEXT_ANSWER_TOKENS)
+    if available == 0:
+        print(f"[Warn] Prompt and {CONTEXT_ANSWER_TOKENS} answer tokens already fill n_ctx={n_ctx}; no context added")
+    return available if budget is None else min(budget, available)
+
+def format_generation_stats(stats: dict) -> str:
+    if stats.get("cached"):
+        return f"[Perf] Cached answer ({stats['cached']} match) | total {stats['total']:.2f}s"
+    return (f"[Perf] TTFT {stats['ttft']:.2f}s | {stats['tokens']} tokens | "
+            f"{stats['tokens_per_sec']:.1f} tok/s | total {stats['total']:.2f}s")
+
+def stream_answer(question, context, model_path, stats: dict = None, history: str = "") -> Iterator[str]:
+    # Stream the LLM response token by token, measuring time-to-first-token and tokens/sec.
+    # Reuse the resident LLaMA.cpp model (loaded once with GPU acceleration settings)
+    llm = model_manager.get(model_path)
+    # Compose the prompt + llm + output parser chain
+    chain = PROMPT | llm | StrOutputParser()
+
+    start = time.perf_counter()
+    first_token_at = None
+    n_tokens = 0
+    with model_manager.generation_lock:
+        for token in chain.stream({"context": context, "question": question, "history": history}):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            n_tokens += 1
+            yield token
+    end = time.perf_counter()
+
+    first_token_at = first_token_at or end
+    decode_time = end - first_token_at
+    result = {
+        "ttft": first_token_at - start,
+        "tokens": n_tokens,
+        "tokens_per_sec": (n_tokens - 1) / decode_time if n_tokens > 1 and decode_time > 0 else 0.0,
+        "total": end - start,
+    }
+    print(f"\n{format_generation_stats(result)}")
+    if stats is not None:
+        stats.update(result)
+
+def generate_answer(question, context, model_path, stats: dict = None):
+    # Generate a complete response from the LLM given the question and retrieved context.
+    return "".join(stream_answer(question, context, model_path, stats))
 
 # === RAG Pipeline (Retrieval-Augmented Generation) with PROVENANCE ===
 def run_rag(question: str, retriever, model_path: str) -> tuple[list[str], str]:
@@ -34,6 +187,11 @@ def run_rag(question: str, retriever, model_path: str) -> tuple[list[str], str]:
     sources, answer = run_rag_with_provenance(question, retriever, model_path)
     return sources, answer
 
+def stream_rag(question: str, retriever, model_path: str, stats: dict = None,
+               history=None) -> tuple[str, Iterator[str]]:
+    # Same as run_rag, but the answer is an iterator of tokens as they are generated.
+    return stream_rag_with_provenance(question, retriever, model_path, stats, history)
+
 # === CLI Argument Parsing ===
 def parse_args():
     parser = argparse.ArgumentParser(description="Local RAG CLI with FAISS and LLaMA")
@@ -41,4 +199,5 @@ def parse_args():
     parser.add_argument("--db-dir", type=str, default=DB_DIR, help="Directory to store/load FAISS index")
     parser.add_argument("--model-path", type=str, default=MODEL_PATH, help="Path to GGUF LLaMA model")
     parser.add_argument("--rebuild-db", action="store_true", help="Force rebuild of FAISS vector store")
+    parser.add_argument("--update-db", action="store_true", help="Embed only new files and append them to the existing FAISS index")
     return parser.parse_args()
\ No newline at end of file
@@ -1,22 +1,24 @@
-import os
 import sys
 
+from functools import partial
+
 from langchain_huggingface import HuggingFaceEmbeddings
 
-from config import EMBED_MODEL_NAME
-from data.db import init_db, is_metadata_db_empty
-from llm import run_rag, parse_args
+from config import EMBED_MODEL_NAME, EMBED_THREADS
+from data.db import get_meta, init_db, is_metadata_db_empty
+from llm import model_manager, stream_rag, parse_args
 from logger import log_exception
-from know.retriever import chunk_documents
-from know.store import create_vector_store, load_vector_store
-from ingest.chunker import split_into_chunks
+from know.embedcache import with_query_cache
+from know.retriever import IngestProgress, iter_chunk_documents
+from know.store import append_to_vector_store, create_vector_store, index_exists, load_vector_store
+from ingest.chunker import split_pages
 
 def setup_retriever():
     args = parse_args()
 
 # --- Consistent check for critical files ---
     metadata_exists = not is_metadata_db_empty()
-    faiss_exists = os.path.exists(os.path.join(args.db_dir, "index.faiss"))
+    faiss_exists = index_exists(args.db_dir)
 
     if not metadata_exists or not faiss_exists:
         if not args.rebuild_db:
@@ -26,23 +28,37 @@ def setup_retriever():
 
     init_db(rebuild=args.rebuild_db)
     print("Database initialized.")
-    embedding = HuggingFaceEmbeddings(model_name=EMBED_MODEL_NAME)
+    if EMBED_THREADS > 0: # intra-op threads of the embedding model on CPU-only machines
+        import torch
+        torch.set_num_threads(EMBED_THREADS)
+    # Validate against what the index was built with, instead of embedding a probe text
+    stored_model = get_meta("embedding_model")
+    if stored_model and stored_model != EMBED_MODEL_NAME and not args.rebuild_db:
+        print(f"[Error] FAISS index was built with '{stored_model}', but EMBED_MODEL_NAME is '{EMBED_MODEL_NAME}'.")
+        print("[Hint] Restore EMBED_MODEL_NAME or run with --rebuild-db to re-embed with the new model.")
+        sys.exit(1)
+    embedding = with_query_cache(HuggingFaceEmbeddings(model_name=EMBED_MODEL_NAME))
     print("Loading model:", EMBED_MODEL_NAME)
-    print("Embedding dimension:", len(embedding.embed_query("test")))
+    print("Embedding dimension:", get_meta("embedding_dim", "not recorded yet"))
 
-    if args.rebuild_db or is_metadata_db_empty() or not os.path.exists(os.path.join(args.db_dir, "index.faiss")):
-        chunks = chunk_documents(args.data_dir, lambda text: split_into_chunks(text, update_map=args.rebuild_db))
-        print(f"[Info] {len(chunks)} good chunks indexed.")
+    if args.update_db and not args.rebuild_db:
+        # iter_chunk_documents skips files whose hash is already in metadata.db
+        progress = IngestProgress.count(args.data_dir) # estimated chunk total for the ETA
+        chunks = iter_chunk_documents(args.data_dir, partial(split_pages, update_map=False), progress)
+        return append_to_vector_store(args.db_dir, chunks, embedding, total=progress.estimate_total)
 
-        if not chunks:
-            raise ValueError("No chunks found. Check your data directory or chunking logic.")
-        return create_vector_store(args.db_dir, chunks, embedding)
+    if args.rebuild_db or is_metadata_db_empty() or not index_exists(args.db_dir):
+        # Chunks are embedded batch by batch while later files are still being loaded
+        progress = IngestProgress.count(args.data_dir)
+        chunks = iter_chunk_documents(args.data_dir, partial(split_pages, update_map=args.rebuild_db), progress)
+        return create_vector_store(args.db_dir, chunks, embedding, total=progress.estimate_total)
     else:
         return load_vector_store(args.db_dir, embedding)
 
 def main():
     args = parse_args()
     retriever = setup_retriever()
+    model_manager.warm_up(args.model_path)
 
     print("Interactive RAG CLI started. Type 'exit' to quit.")
 
@@ -53,9 +69,11 @@ def main():
             break
 
         try:
-            sources, response = run_rag(query, retriever, args.model_path)
-            print("\nw\n", sources)
-            print("\nAssistant:\n", response)
+            sources, tokens = stream_rag(query, retriever, args.model_path)
+            print("\nAssistant:")
+            for token in tokens: # print tokens as llama.cpp produces them
+                print(token, end="", flush=True)
+            print("\n\nSources:\n", sources)
         except Exception as e:
             log_exception("Error during RAG pipeline", e, context=query)
     return retriever
@@ -3,9 +3,10 @@ import socket
 import threading
 import time
 
-from config import MODEL_PATH
+from config import CHAT_HISTORY_TURNS, MODEL_PATH
+from llm import format_generation_stats, model_manager
 from main import setup_retriever
-from know.provenance import run_rag_with_provenance
+from know.provenance import stream_rag_with_provenance
 
 retriever = None
 
@@ -14,14 +15,39 @@ def print_local_ip():
     local_ip = socket.gethostbyname(hostname)
     print(f"Web UI running at http://{local_ip}:7860")
 
+def chat_turns(history, limit: int = CHAT_HISTORY_TURNS) -> list[tuple[str, str]]:
+    """Last (question, answer) pairs of the chat, without the sources/perf footer
+    gradio_rag appends. Accepts Gradio's tuple and message history formats."""
+    if not limit or not history:
+        return []
+    if isinstance(history[0], dict):
+        pairs, question = [], None
+        for message in history:
+            if message.get("role") == "user":
+                question = message.get("content")
+            elif message.get("role") == "assistant" and question is not None:
+                pairs.append((question, message.get("content")))
+                question = None
+    else:
+        pairs = [tuple(turn) for turn in history]
+    turns = [(str(q), str(a).split("\n\nSources: ")[0]) for q, a in pairs if q and a]
+    return turns[-limit:]
+
 def gradio_rag(query, history):
+    # Generator: Gradio re-renders the chat message on every yield.
+    answer, stats = "", {}
     try:
         print(f"Got query: {query}")
-        sources, answer = run_rag_with_provenance(query, retriever, MODEL_PATH)
+        # Earlier turns form a shared prompt prefix, restored from llama.cpp's prompt cache
+        sources, tokens = stream_rag_with_provenance(query, retriever, MODEL_PATH, stats, chat_turns(history))
+        for token in tokens:
+            answer += token
+            yield answer
     except Exception as e:
         print(f"[ERROR] Failed to run RAG: {e}")
-        sources, answer = "Error:", str(e)
-    return answer + "\n\nSources: " + sources
+        sources, answer = "Error:", answer + str(e)
+    footer = f"\n\n{format_generation_stats(stats)}" if stats else ""
+    yield answer + "\n\nSources: " + sources + footer
 
 iface = gr.ChatInterface(
     fn=gradio_rag,
@@ -46,7 +72,9 @@ def launch_gradio():
 if __name__ == "__main__":
     def retriever_loader():
         global retriever
-        retriever = setup_retriever()
+        loaded = setup_retriever()
+        model_manager.warm_up(MODEL_PATH) # load the LLM before the UI accepts queries
+        retriever = loaded
 
     thread = threading.Thread(target=retriever_loader)
     thread.start()
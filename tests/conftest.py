@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+# Run against the defaults of config.template.py when no local config.py exists
+if importlib.util.find_spec("config") is None:
+    spec = importlib.util.spec_from_file_location("config", os.path.join(SRC, "config.template.py"))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules["config"] = config
+
+import pytest
+
+
+@pytest.fixture
+def metadata_db(tmp_path, monkeypatch):
+    """data.db pointed at an empty metadata.db in tmp_path."""
+    db = pytest.importorskip("data.db")
+    db.close_all_connections()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "metadata.db")
+    yield db
+    db.close_all_connections()
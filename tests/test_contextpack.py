@@ -0,0 +1,31 @@
+from langchain.schema import Document
+
+from know.contextpack import join_chunks, pack_context
+
+
+def _count(text):
+    return len(text.split())
+
+
+def _chunks(texts, doc_id=1):
+    return [Document(page_content=t, metadata={"doc_id": doc_id, "chunk_id": 100 + i, "chunk_index": i})
+            for i, t in enumerate(texts)]
+
+
+def test_join_drops_overlap_on_word_boundaries():
+    assert join_chunks("one two three four", "three four five") == "one two three four five"
+
+
+def test_neighbours_merge_in_relevance_order():
+    docs = _chunks(["a b c d", "c d e f", "e f g h", "x y z w"])
+    packed = pack_context([docs[2], docs[0], docs[1]], _count)
+    assert len(packed) == 1
+    assert packed[0].metadata["chunk_indexes"] == [0, 1, 2]
+    assert packed[0].page_content == "a b c d e f g h"
+
+
+def test_budget_zero_packs_nothing_and_none_packs_all():
+    docs = _chunks(["a b c d", "x y z w v"])
+    assert pack_context(docs, _count, budget=0) == []
+    assert len(pack_context(docs, _count, budget=None)) == 1
+    assert [d.metadata["chunk_ids"] for d in pack_context(docs[::-1], _count, budget=14)] == [[101]]
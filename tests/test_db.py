@@ -0,0 +1,56 @@
+import sqlite3
+
+
+def test_edited_document_gets_new_chunk_ids(metadata_db):
+    db = metadata_db
+    doc = db.insert_document("/data/a.txt", "a", "h1", "txt", "m")
+    old_ids = db.insert_chunks(doc, [("first", {}), ("second", {})])
+
+    tombstoned = db.delete_document(doc)
+    doc = db.insert_document("/data/a.txt", "a", "h2", "txt", "m")
+    new_ids = db.insert_chunks(doc, [("first, edited", {}), ("second", {})])
+
+    assert tombstoned == old_ids
+    assert not set(new_ids) & db.get_tombstones()
+
+
+def test_old_chunks_table_is_migrated(metadata_db):
+    db = metadata_db
+    with sqlite3.connect(db.DB_PATH) as conn:
+        conn.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, path TEXT UNIQUE, title TEXT, hash TEXT UNIQUE,"
+                     " timestamp TEXT, source_type TEXT, embedding_model TEXT)")
+        conn.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, document_id INTEGER, chunk_index INTEGER,"
+                     " content TEXT)")
+        conn.execute("CREATE TABLE chunk_tombstones (chunk_id INTEGER PRIMARY KEY, deleted_at TEXT)")
+        conn.execute("INSERT INTO documents (id, path, hash) VALUES (1, '/data/a.txt', 'h1')")
+        conn.execute("INSERT INTO chunks (id, document_id, chunk_index, content) VALUES (3, 1, 0, 'kept text')")
+        conn.execute("INSERT INTO chunk_tombstones VALUES (7, datetime('now'))")
+
+    new_ids = db.insert_chunks(1, [("new text", {})])
+
+    assert new_ids == [8] # above the tombstoned id, whose vector may still be in FAISS
+    assert db.get_chunks_by_ids([3])[3]["content"] == "kept text"
+    assert db.search_chunks("kept")[0]["chunk_id"] == 3 # FTS still points at the migrated rows
+
+
+def test_rejected_chunk_scores_follow_the_file(metadata_db):
+    db = metadata_db
+    rejected = [(0, {"quality": (12, 0.5, 0.2, 0.4), "page": 1}), (3, {"quality": (0, 0.0, 0.0, 0.0), "page": None})]
+    db.replace_rejected_chunks("/data/a.pdf", "h1", rejected)
+    db.replace_rejected_chunks("/data/a.pdf", "h1", rejected[:1]) # re-ingested
+    conn = db.get_connection()
+    assert conn.execute("SELECT position, page, length, alnum_ratio FROM rejected_chunks").fetchall() == [(0, 1, 12, 0.2)]
+
+    doc = db.insert_document("/data/a.pdf", "a", "h1", "pdf", "m")
+    db.delete_document(doc)
+    assert not conn.execute("SELECT * FROM rejected_chunks").fetchall()
+
+
+def test_metadata_by_content_uses_fts_for_long_snippets(metadata_db):
+    db = metadata_db
+    doc = db.insert_document("/data/a.txt", "a", "h1", "txt", "m")
+    db.insert_chunks(doc, [("the quick brown fox jumps over the lazy dog", {}), ("x-1", {})])
+
+    assert db.fetch_metadata_by_content("ick brown fox jumps ov")["path"] == "/data/a.txt"
+    assert db.fetch_metadata_by_content("ick brown cat jumps ov") == {} # FTS miss, no full scan
+    assert db.fetch_metadata_by_content("x-1")["title"] == "a" # too few whole tokens: LIKE
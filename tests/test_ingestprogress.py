@@ -0,0 +1,14 @@
+import pytest
+
+retriever = pytest.importorskip("know.retriever")
+
+
+def test_estimate_scales_chunks_by_bytes_done():
+    progress = retriever.IngestProgress(files=4, bytes_total=4000)
+    assert progress.estimate_total() is None
+    progress.file_done(1000, 30)
+    assert progress.estimate_total() == 120
+    progress.file_done(1000) # duplicate or rejected file: no chunks
+    assert progress.estimate_total() == 60
+    progress.file_done(2000, 90)
+    assert progress.estimate_total() == 120 # everything processed: exact
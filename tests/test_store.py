@@ -0,0 +1,182 @@
+import os
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+from langchain_community.vectorstores import FAISS
+
+from know.docstore import SQLiteDocstore
+from know.faissindex import build_index, defer_remove, rebuild_without, uses_labels
+from know.store import _add_vectors, _empty_vectorstore, _remove_vectors
+
+
+def _store(kind, n=2000, dim=16, labelled=True):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((n, dim), dtype=np.float32)
+    index, config = build_index(kind, dim, n, vectors)
+    if not labelled: # as saved before IVF indexes were labelled with chunk ids
+        config.pop("labels", None)
+    store = _empty_vectorstore(None, index, config)
+    _add_vectors(store, vectors, [str(1000 + i) for i in range(n)])
+    return store, vectors
+
+
+def _found_ids(store, vectors):
+    _, labels = store.index.search(vectors, 1)
+    return [store.index_to_docstore_id[int(label)] for label in labels[:, 0]]
+
+
+@pytest.mark.parametrize("kind,labelled", [("flat", True), ("hnsw", True), ("ivf_flat", True),
+                                           ("ivf_sq8", True), ("ivf_flat", False)])
+def test_remove_keeps_ids_aligned(kind, labelled):
+    store, vectors = _store(kind, labelled=labelled)
+    assert _remove_vectors(store, [str(1000 + i) for i in range(1000)]) == 1000
+
+    assert store.index.ntotal == 1000
+    assert uses_labels(store.index_config) == kind.startswith("ivf") # positional IVF is relabelled
+    if not uses_labels(store.index_config):
+        assert sorted(store.index_to_docstore_id) == list(range(1000))
+    # Every kept vector must still be found under its own chunk id
+    found = _found_ids(store, vectors[1000:])
+    expected = [str(1000 + i) for i in range(1000, 2000)]
+    assert np.mean([a == b for a, b in zip(found, expected)]) > 0.95
+
+
+def test_labelled_ivf_removes_in_place():
+    store, vectors = _store("ivf_sq8")
+    index = store.index
+    assert _remove_vectors(store, {1000, 1001, 99999}) == 2 # unknown ids are ignored
+    assert store.index is index and index.ntotal == 1998
+    assert sorted(store.index_to_docstore_id)[:2] == [1002, 1003]
+
+
+def test_rebuild_copies_in_batches():
+    store, vectors = _store("hnsw", n=1000)
+    fresh = rebuild_without(store.index, store.index_config, range(1, 1000, 2), batch_size=64)
+    assert fresh.ntotal == 500
+    np.testing.assert_allclose(fresh.reconstruct(0), vectors[1], rtol=1e-6)
+
+
+def test_hnsw_deletes_wait_for_a_rebuild():
+    assert defer_remove({"type": "hnsw"}, 5, 1000)
+    assert not defer_remove({"type": "hnsw"}, 500, 1000)
+    assert not defer_remove({"type": "ivf_flat", "labels": "chunk_id"}, 5, 1000)
+
+
+class _FakeEmbeddings:
+    def __init__(self, dim=16):
+        self.rng = np.random.default_rng(1)
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return self.rng.random((len(texts), self.dim), dtype=np.float32).tolist()
+
+
+def test_new_index_is_sized_for_all_chunks(monkeypatch, tmp_path):
+    from langchain.schema import Document
+    import know.store as store
+
+    import know.faissindex as faissindex
+    monkeypatch.setattr(store, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(faissindex, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(store, "FAISS_TRAIN_SAMPLE", 500)
+    chunks = (Document(page_content=f"chunk {i}", metadata={"chunk_id": 1000 + i}) for i in range(3000))
+    vectorstore, count = store.embed_in_batches(chunks, _FakeEmbeddings(), batch_size=256, spill_dir=tmp_path)
+
+    assert count == 3000
+    assert vectorstore.index.ntotal == 3000
+    assert vectorstore.index_config["type"] == "ivf_flat"
+    assert vectorstore.index_config["n_expected"] == 3000
+    assert sorted(vectorstore.index_to_docstore_id) == list(range(1000, 4000)) # labelled with chunk ids
+    assert not list(tmp_path.iterdir()) # spill file removed
+
+
+def test_save_switches_versions_atomically(tmp_path):
+    from know.store import CURRENT_FILE, LOCK_FILE, _load_faiss, index_dir, index_exists, save_vector_store
+
+    assert not index_exists(tmp_path)
+    (tmp_path / "index.faiss").write_bytes(b"old layout") # pre-versioned files are cleaned up
+    store, _ = _store("flat", n=100)
+    save_vector_store(store, tmp_path)
+    first = index_dir(tmp_path)
+    assert index_exists(tmp_path) and not (tmp_path / "index.faiss").exists()
+
+    store, _ = _store("flat", n=50)
+    save_vector_store(store, tmp_path)
+    second = index_dir(tmp_path)
+    assert second != first
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([CURRENT_FILE, LOCK_FILE, os.path.basename(second)])
+    assert _load_faiss(tmp_path, None).index.ntotal == 50
+
+
+def test_append_removes_vectors_of_an_edited_file(metadata_db, monkeypatch, tmp_path):
+    from langchain.schema import Document
+    import know.embedcache as embedcache
+    import know.store as store
+
+    monkeypatch.setattr(embedcache, "EMBED_CACHE", False)
+    db = metadata_db
+
+    def ingest(content_hash, texts):
+        existing = db.get_document_by_path("/data/a.txt")
+        if existing: # what know.retriever does for a changed file
+            db.delete_document(existing["id"])
+        doc = db.insert_document("/data/a.txt", "a", content_hash, "txt", "m")
+        for chunk_id, text in zip(db.insert_chunks(doc, [(t, {}) for t in texts]), texts):
+            yield Document(page_content=text, metadata={"chunk_id": chunk_id})
+
+    store.create_vector_store(tmp_path / "faiss", ingest("h1", ["old one", "old two"]), _FakeEmbeddings())
+    store.append_to_vector_store(tmp_path / "faiss", ingest("h2", ["new one", "new two"]), _FakeEmbeddings())
+
+    vectorstore = store._load_faiss(tmp_path / "faiss", None)
+    chunk_ids = sorted(int(i) for i in vectorstore.index_to_docstore_id.values())
+    assert chunk_ids == sorted(db.get_chunks_by_ids(chunk_ids)) == [3, 4]
+    assert not db.get_tombstones()
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_estimated_total_is_resolved_before_sizing(monkeypatch, kind):
+    from langchain.schema import Document
+    import know.faissindex as faissindex
+    import know.store as store
+
+    monkeypatch.setattr(store, "FAISS_INDEX_TYPE", kind)
+    monkeypatch.setattr(faissindex, "FAISS_INDEX_TYPE", kind)
+    chunks = (Document(page_content=f"chunk {i}", metadata={"chunk_id": i}) for i in range(300))
+    vectorstore, count = store.embed_in_batches(chunks, _FakeEmbeddings(), batch_size=100, total=lambda: 300)
+
+    assert count == vectorstore.index.ntotal == 300
+    assert vectorstore.index_config["n_expected"] == 300
+
+
+def test_save_keeps_only_the_current_version(tmp_path):
+    from know.store import TMP_PREFIX, index_dir, save_vector_store
+
+    store, _ = _store("flat", n=100)
+    save_vector_store(store, tmp_path)
+    (tmp_path / f"{TMP_PREFIX}dead").mkdir() # left by a writer that crashed
+    save_vector_store(store, tmp_path)
+
+    dirs = sorted(p.name for p in tmp_path.iterdir() if p.is_dir())
+    assert dirs == [os.path.basename(index_dir(tmp_path))]
+
+
+def test_compaction_skips_while_another_writer_holds_the_lock(metadata_db, tmp_path, capsys):
+    from filelock import FileLock
+    from know.store import LOCK_FILE, compact_vector_store, save_vector_store
+
+    store, _ = _store("flat", n=100)
+    save_vector_store(store, tmp_path)
+    doc = metadata_db.insert_document("/data/a.txt", "a", "h1", "txt", "m")
+    metadata_db.delete_document(doc)
+    metadata_db.get_connection().execute("INSERT INTO chunk_tombstones VALUES (1000, datetime('now'))")
+    metadata_db.get_connection().commit()
+
+    with FileLock(str(tmp_path / LOCK_FILE)): # another process appending
+        compact_vector_store(tmp_path, None)
+    assert "skipped" in capsys.readouterr().out
+    assert metadata_db.get_tombstones() == {1000}
+
+    compact_vector_store(tmp_path, None)
+    assert not metadata_db.get_tombstones()